@@ -1,16 +1,67 @@
-from main.db import execute_query, get_connection
-from psycopg2.errors import UniqueViolation
+from main.db import lease
+from psycopg2.extras import execute_values
+from psycopg2 import Error
 from dataclasses import dataclass, field
 from typing import Optional, List
 from tools.logger import logger
 from datetime import datetime
+import psycopg
+import main.adb as adb
+
+
+#########################################
+# Queries shared by the sync/async paths
+
+POST_INSERT_QUERY = """
+    INSERT INTO posts (
+        id, user_id, timestamp, username, handle, text, reposts, likes, replies, views, repost
+    ) VALUES {values}
+"""
+
+# No conflict target: id alone is the primary key, so a post stored with the other
+# repost value must be skipped too instead of failing the whole batch
+POSTS_INSERT_MANY_QUERY = POST_INSERT_QUERY + """
+    ON CONFLICT DO NOTHING
+    RETURNING id
+"""
+
+USERS_UPSERT_QUERY = """
+    INSERT INTO users (
+        account_id, handle, username, certified, bio, created_at,
+        following_count, followers_count, following_str, followers_str,
+        featured_url, follower
+    ) VALUES {values}
+    ON CONFLICT (handle, created_at) DO UPDATE SET
+        username = EXCLUDED.username,
+        certified = EXCLUDED.certified,
+        bio = EXCLUDED.bio,
+        following_count = EXCLUDED.following_count,
+        followers_count = EXCLUDED.followers_count,
+        following_str = EXCLUDED.following_str,
+        followers_str = EXCLUDED.followers_str,
+        featured_url = EXCLUDED.featured_url,
+        follower = EXCLUDED.follower
+    RETURNING id, handle
+"""
+
+
+# Profile fields shown by each cell of the followers list, read while harvesting handles (triage)
+@dataclass(frozen=True)
+class FollowerCell:
+    handle: str
+    username: Optional[str] = None
+    certified: bool = False
+    bio: Optional[str] = None
 
 
 # Used to pass information from Extract to Transform
 @dataclass(frozen=True) # Freeze it to make it immutable
 class UserExtract:
     handle: str
-    html: str
+    html: Optional[str] = None
+    data: Optional[dict] = None # Profile fields already extracted in the browser (evaluate mode)
+    graphql: Optional[dict] = None # GraphQL payloads captured by operation name (network mode)
+    newest_post_id: Optional[int] = None # Newest post of the user already in DB, older posts are skipped
 
 
 @dataclass
@@ -27,30 +78,53 @@ class XPost:
     repost: bool
     user_id: Optional[int] = None
 
-    def insert(self):
-        insert_query = """
-            INSERT INTO posts (
-                id, user_id, timestamp, username, handle, text, reposts, likes, replies, views, repost
-            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+    def as_row(self):
+        # Values in the column order of POST_INSERT_QUERY
+        return (
+            self.id, self.user_id, self.timestamp, self.username,
+            self.handle, self.text, self.replies, self.reposts,
+            self.likes, self.views, self.repost
+        )
+
+    @staticmethod
+    def insert_many(posts, connection):
+        """Insert a batch of posts in a single statement, skipping the ones already stored
+        Args:
+            posts: XPost instances, with their user_id set
+            connection: The connection to run the statement on
+        Returns:
+            The number of posts actually inserted, None if the insertion failed
         """
+        if not posts:
+            return 0
         try:
-            execute_query(
-                get_connection(),
-                insert_query,
-                (
-                    self.id, self.user_id, self.timestamp, self.username,
-                    self.handle, self.text, self.replies, self.reposts,
-                    self.likes, self.views, self.repost
-                ),
-                do_raise = True
-            )
-
-        except UniqueViolation:
-            logger.info(f'Post {self.id} already in DB - Stopping post insertions for user ID {self.user_id}')
-            raise # re-raises the same exception to the caller
+            with connection.cursor() as cur:
+                inserted = execute_values(
+                    cur, POSTS_INSERT_MANY_QUERY.format(values='%s'), [post.as_row() for post in posts],
+                    page_size=len(posts), fetch=True
+                )
+                return len(inserted)
+        except Error as e:
+            logger.error(f'Posts insertion into database failed: {e}')
+            if not connection.autocommit:
+                connection.rollback()
+            return None
 
-        except Exception as e:
-            logger.error('Post insertion into database failed', e)
+    @staticmethod
+    async def ainsert_many(posts, connection):
+        """Async counterpart of insert_many()"""
+        if not posts:
+            return 0
+        placeholders, params = adb.values_list([post.as_row() for post in posts])
+        try:
+            async with connection.cursor() as cur:
+                await cur.execute(POSTS_INSERT_MANY_QUERY.format(values=placeholders), params)
+                return len(await cur.fetchall())
+        except psycopg.Error as e:
+            logger.error(f'Posts insertion into database failed: {e}')
+            if not connection.autocommit:
+                await connection.rollback()
+            return None
 
 
 @dataclass
@@ -73,55 +147,86 @@ class XUser:
     def add_article(self, article_html):
         self.articles.append(article_html)
 
-    def upsert(self):
-        upsert_query = """
-            insert INTO users (
-                account_id, handle, username, certified, bio, created_at,
-                following_count, followers_count, following_str, followers_str,
-                featured_url, follower
-            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            ON CONFLICT (handle, created_at) DO UPDATE SET
-                username = EXCLUDED.username,
-                certified = EXCLUDED.certified,
-                bio = EXCLUDED.bio,
-                following_count = EXCLUDED.following_count,
-                followers_count = EXCLUDED.followers_count,
-                following_str = EXCLUDED.following_str,
-                followers_str = EXCLUDED.followers_str,
-                featured_url = EXCLUDED.featured_url,
-                follower = EXCLUDED.follower
-            RETURNING id;
-            """
+    def as_row(self):
+        # Values in the column order of the upsert queries
+        return (
+            self.account_id, self.handle, self.username,
+            self.certified, self.bio, self.created_at,
+            self.following_count, self.followers_count,
+            self.following_str, self.followers_str,
+            self.featured_url, self.follower
+        )
+
+    @staticmethod
+    def upsert_many(users):
+        """Upsert a batch of users and insert all of their posts in a single transaction
+        Args:
+            users: XUser instances, their id is set once upserted
+        Returns:
+            A (upserted users, inserted posts) tuple, None if the transaction failed
+        """
+        # A row can't be upserted twice by the same statement: keep the latest version of each user
+        users = list({user.handle: user for user in users}.values())
+        if not users:
+            return 0, 0
+
+        try:
+            with lease(autocommit=False) as connection:
+                with connection.cursor() as cur:
+                    rows = execute_values(
+                        cur, USERS_UPSERT_QUERY.format(values='%s'), [user.as_row() for user in users],
+                        page_size=len(users), fetch=True
+                    )
+
+                posts = XUser.assign_ids(users, rows)
+                insertion_count = XPost.insert_many(posts, connection)
+                if insertion_count is None:
+                    raise Error('Posts insertion failed')
+
+        except Exception as e:
+            logger.error(f'Users batch upsertion into database failed: {e}')
+            return None
+
+        logger.info(f'Upserted {len(users)} users and inserted {insertion_count} new posts in one transaction')
+        return len(users), insertion_count
+
+    @staticmethod
+    def assign_ids(users, rows):
+        """Set the id returned by the upsert query on each user and its posts
+        Returns:
+            The posts of every user of the batch
+        """
+        user_ids = {handle: user_id for user_id, handle in rows}
+        posts = []
+        for user in users:
+            user.id = user_ids[user.handle]
+            for post in user.articles:
+                post.user_id = user.id
+                posts.append(post)
+        return posts
+
+    @staticmethod
+    async def aupsert_many(users):
+        """Async counterpart of upsert_many()"""
+        users = list({user.handle: user for user in users}.values())
+        if not users:
+            return 0, 0
+
+        placeholders, params = adb.values_list([user.as_row() for user in users])
         try:
-            res = execute_query(
-                get_connection(),
-                upsert_query,
-                (
-                    self.account_id, self.handle, self.username,
-                    self.certified, self.bio, self.created_at,
-                    self.following_count, self.followers_count,
-                    self.following_str, self.followers_str,
-                    self.featured_url, self.follower
-                ),
-                fetchone = True
-            )
-            self.id = res[0]
+            async with adb.lease(autocommit=False) as connection:
+                async with connection.cursor() as cur:
+                    await cur.execute(USERS_UPSERT_QUERY.format(values=placeholders), params)
+                    rows = await cur.fetchall()
+
+                posts = XUser.assign_ids(users, rows)
+                insertion_count = await XPost.ainsert_many(posts, connection)
+                if insertion_count is None:
+                    raise psycopg.Error('Posts insertion failed')
 
         except Exception as e:
-            logger.error('User upsertion into database failed', e)
-            return
-
-        if self.articles:
-            insertion_count = 0
-            for post in self.articles:
-                try:
-                    post.user_id = self.id
-                    post.insert()
-                    insertion_count += 1
-                except UniqueViolation:
-                    break
-
-            if not insertion_count:
-                logger.info(f'Already up-to-date: No new post insertions for user ID {self.id}')
-            else:
-                logger.info(f'Inserted {insertion_count} new posts for user ID {self.id}')
+            logger.error(f'Users batch upsertion into database failed: {e}')
+            return None
+
+        logger.info(f'Upserted {len(users)} users and inserted {insertion_count} new posts in one transaction')
+        return len(users), insertion_count
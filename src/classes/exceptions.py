@@ -3,3 +3,9 @@ class NotLoggedInError(Exception):
     """Custom exception when we are not logged in on X"""
     def __init__(self, message='User is not logged in'):
         super().__init__(message)
+
+
+class RateLimitedError(Exception):
+    """Custom exception when X refuses to serve more pages for now (HTTP 429)"""
+    def __init__(self, message='Rate limited by X'):
+        super().__init__(message)
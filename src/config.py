@@ -14,7 +14,13 @@ def parse_args():
     parser.add_argument('--json', action='store_true', help='Json formatted logs')
     parser.add_argument('--head', action='store_true', help='Use firefox in headed mode (visible)')
     parser.add_argument('--dev', action='store_true', help='Run in dev (local, non-virtualized) mode')
-    return parser.parse_args()
+    parser.add_argument('--resume', action='store_true', help='Continue the last unfinished run from its checkpoint')
+    # Distributed mode: one coordinator queues the followers to extract, any number of workers process them
+    parser.add_argument('--coordinator', action='store_true', help='Harvest the followers list and queue extraction jobs')
+    parser.add_argument('--worker', action='store_true', help='Process the queued extraction jobs')
+    parser.add_argument('--daemon', action='store_true', help='Keep running and crawl on a schedule (settings.json: daemon)')
+    # Ignore unknown arguments so that modules stay importable from other entry points (pytest...)
+    return parser.parse_known_args()[0]
 
 
 def get_settings():
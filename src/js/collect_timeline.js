@@ -0,0 +1,31 @@
+({seen}) => {
+    // Runs at each step of the timeline scroller (page.evaluate) and returns the posts rendered since the previous step.
+    // The timeline is virtualized: posts scrolled past are removed from the DOM, so they are collected as they show up.
+    // Only the markup of each post goes back to Python, the transform parses it the same way as a whole page.
+    const seenIds = new Set(seen);
+    const posts = [];
+
+    for (const article of document.querySelectorAll('section[role="region"] article[data-testid="tweet"]')) {
+        // Same lookup as main/transform.py: last status link of the handle/datetime wrapper
+        const pbagChildren = article.querySelectorAll('div[data-testid="User-Name"] > div');
+        if (pbagChildren.length < 2) continue;
+        const statusLinks = Array.from(pbagChildren[1].querySelectorAll('a'))
+            .filter(a => (a.getAttribute('href') || '').includes('status/') && !a.querySelector('a'));
+        if (!statusLinks.length) continue;
+
+        const href = statusLinks.pop().getAttribute('href'); // ie: /handle/status/id
+        const id = href.split('/').pop();
+        if (seenIds.has(id)) continue;
+        seenIds.add(id);
+
+        const timeElem = pbagChildren[1].querySelector('time');
+        posts.push({
+            id: id,
+            author: href.split('/')[1],
+            repost: article.querySelector('span[data-testid="socialContext"]') !== null,
+            timestamp: timeElem ? timeElem.getAttribute('datetime') : null,
+            html: article.outerHTML
+        });
+    }
+    return posts;
+}
@@ -0,0 +1,85 @@
+(handle) => {
+    // Runs inside the profile page (page.evaluate) and returns the raw profile fields as a compact object.
+    // Mirrors the element lookups of main/transform.py so that both extraction modes produce the same XUser/XPost.
+    // Display strings (counts, join date, timestamps) are returned as-is, conversions are made in Python.
+    const hasText = (elem) => elem.textContent.trim() !== '';
+
+    // Equivalent of BeautifulSoup's Tag.string: only defined for a single child chain ending with a text node
+    const tagString = (elem) => {
+        if (elem.childNodes.length !== 1) return null;
+        const child = elem.childNodes[0];
+        if (child.nodeType === Node.TEXT_NODE) return child.nodeValue;
+        return child.nodeType === Node.ELEMENT_NODE ? tagString(child) : null;
+    };
+
+    // First span with some text and no nested span
+    const leafSpan = (wrapper) => Array.from(wrapper.querySelectorAll('span'))
+        .find(span => hasText(span) && !span.querySelector('span'));
+
+    const findSpan = (wrapper, pattern) => wrapper && Array.from(wrapper.querySelectorAll('span'))
+        .find(span => pattern.test(tagString(span) || ''));
+
+    const getArticle = (article) => {
+        const reposted = article.querySelector('span[data-testid="socialContext"]') !== null;
+
+        // Two children: username wrapper, then handle/datetime wrapper
+        const pbagChildren = article.querySelector('div[data-testid="User-Name"]').querySelectorAll(':scope > div');
+        const userhandleDtWrapper = pbagChildren[1];
+
+        const statusLinks = Array.from(userhandleDtWrapper.querySelectorAll('a'))
+            .filter(a => (a.getAttribute('href') || '').includes('status/') && !a.querySelector('a'));
+        const usernameElem = leafSpan(pbagChildren[0]);
+        const timeElem = userhandleDtWrapper.querySelector('time');
+        const tweetTextSpan = article.querySelector('div[data-testid="tweetText"] span');
+
+        return {
+            id: statusLinks.pop().getAttribute('href').split('/').pop(),
+            handle: leafSpan(userhandleDtWrapper).textContent.slice(1),
+            username: usernameElem ? usernameElem.textContent : null,
+            timestamp: timeElem.getAttribute('datetime'),
+            // Equivalent of tools.utils.get_stats() for each interaction counter
+            stats: Array.from(article.querySelectorAll('span[data-testid="app-text-transition-container"]'))
+                .map(container => {
+                    const counter = container.querySelector('span span');
+                    const value = counter ? counter.querySelector('span') : null;
+                    return value ? value.textContent : '0';
+                }),
+            text: tweetTextSpan ? tweetTextSpan.textContent : null,
+            repost: reposted
+        };
+    };
+
+    const userNameWrapper = document.querySelector('div[data-testid="UserName"]');
+    const userNameElem = Array.from(userNameWrapper.querySelectorAll('div'))
+        .find(div => hasText(div) && !div.querySelector('div'));
+
+    const bioWrapper = document.querySelector('[data-testid="UserDescription"]');
+    const bioElem = bioWrapper ? Array.from(bioWrapper.querySelectorAll('span')).find(hasText) : null;
+
+    const joinedElem = findSpan(document.querySelector('[data-testid="UserJoinDate"]'), /\d{4}/);
+    const followingElem = findSpan(document.querySelector(`a[href="/${handle}/following"]`), /\d( (M|k))?/);
+    const followersElem = findSpan(document.querySelector(`a[href="/${handle}/verified_followers"]`), /\d( (M|k))?/);
+
+    // First text node of the featured link that looks like a domain name
+    let url = null;
+    const userUrl = document.querySelector('[data-testid="UserProfileHeader_Items"] [data-testid="UserUrl"]');
+    if (userUrl) {
+        const walker = document.createTreeWalker(userUrl, NodeFilter.SHOW_TEXT);
+        for (let node = walker.nextNode(); node && url === null; node = walker.nextNode()) {
+            if (/[\p{L}\p{N}_]+\.[\p{L}\p{N}_]+(\/[\p{L}\p{N}_]+)?/u.test(node.nodeValue)) url = node.nodeValue;
+        }
+    }
+
+    const feedRegion = document.querySelector('section[role="region"]');
+
+    return {
+        username: userNameElem.textContent,
+        certified: userNameWrapper.querySelector('svg[data-testid="icon-verified"]') !== null,
+        bio: bioElem ? bioElem.textContent : null,
+        joined: joinedElem.textContent,
+        following_str: followingElem.textContent,
+        followers_str: followersElem.textContent,
+        url: url,
+        articles: Array.from(feedRegion.querySelectorAll('article[data-testid="tweet"]')).map(getArticle)
+    };
+}
@@ -0,0 +1,23 @@
+(cells) => cells.map(cell => {
+    // Runs on the rendered cells of the followers list (locator.evaluate_all) and returns what each one shows:
+    // enough to triage the followers without loading their profile page.
+    const avatarLink = cell.querySelector('a[role="link"][aria-hidden="true"]');
+    if (!avatarLink) return null;
+    const handle = avatarLink.getAttribute('href').slice(1);
+
+    // First text link that isn't the @handle one
+    const nameLink = Array.from(cell.querySelectorAll('a[role="link"]:not([aria-hidden="true"])'))
+        .find(a => a.textContent.trim() && !a.textContent.trim().startsWith('@'));
+
+    // The bio is the last text block out of the links, the "Follows you" badge excepted
+    const bioElem = Array.from(cell.querySelectorAll('div[dir="auto"]'))
+        .filter(div => !div.closest('a') && !div.closest('[data-testid="userFollowIndicator"]'))
+        .pop();
+
+    return {
+        handle: handle,
+        username: nameLink ? nameLink.textContent.trim() : null,
+        certified: cell.querySelector('svg[data-testid="icon-verified"]') !== null,
+        bio: bioElem && bioElem.textContent.trim() ? bioElem.textContent.trim() : null
+    };
+})
@@ -0,0 +1,26 @@
+({ minArticles, quietMs, maxWaitMs }) => new Promise(resolve => {
+    // Resolves as soon as the timeline shows enough posts, or the DOM stopped changing for quietMs,
+    // or maxWaitMs is reached, whichever comes first
+    const start = performance.now();
+    let lastMutation = start;
+    const observer = new MutationObserver(() => { lastMutation = performance.now(); });
+    observer.observe(document.body, { childList: true, subtree: true, characterData: true });
+
+    const check = () => {
+        const now = performance.now();
+        const articles = document.querySelectorAll('article[data-testid="tweet"]').length;
+
+        let reason = null;
+        if (minArticles && articles >= minArticles) reason = 'posts';
+        else if (now - lastMutation >= quietMs) reason = 'quiet';
+        else if (now - start >= maxWaitMs) reason = 'timeout';
+
+        if (reason) {
+            observer.disconnect();
+            resolve({ reason: reason, articles: articles, elapsed: Math.round(now - start) });
+        } else {
+            setTimeout(check, 100);
+        }
+    };
+    check();
+})
@@ -0,0 +1,180 @@
+from main.db import get_host, get_db_password
+import main.db as db
+from contextlib import asynccontextmanager
+from functools import partial
+from psycopg_pool import AsyncConnectionPool
+from psycopg import errors, Error
+from config import settings, env
+from tools.logger import logger
+import asyncio
+
+
+# Async counterpart of main.db, used by the load stage when db.driver is "async"
+# so that writing to the database never blocks the event loop the browser pages run on.
+# Database setup (--setup) keeps going through the sync path.
+
+_pool = None # Async connection pool to the pipeline database, opened on first lease
+
+
+######################
+# Connection pooling
+
+async def get_pool():
+    """
+    Opens the async connection pool to the pipeline database on first call.
+
+    Returns:
+        psycopg AsyncConnectionPool.
+    """
+    global _pool
+    if _pool is None:
+        conninfo = (
+            f'dbname={settings["db"]["dbname"]} user={settings["db"]["pipeline_user"]} '
+            f'host={get_host()} port={settings["db"]["port"]}'
+        )
+        pool = AsyncConnectionPool(
+            conninfo,
+            # Passed apart so that an empty password doesn't break the conninfo string
+            kwargs={'password': get_db_password()},
+            min_size=settings['db']['pool_min'],
+            max_size=settings['db']['pool_max'],
+            open=False
+        )
+        await pool.open()
+        _pool = pool
+        logger.debug(f'Async connection pool opened ({settings["db"]["pool_min"]}-{settings["db"]["pool_max"]} connections)')
+    return _pool
+
+
+@asynccontextmanager
+async def lease(autocommit=True):
+    """
+    Borrows a connection from the async pool for the duration of the async with block.
+
+    Args:
+        autocommit (bool): Set to False to run the whole block in a single transaction,
+            committed when the block exits normally and rolled back otherwise.
+    """
+    pool = await get_pool()
+    # The pool commits (or rolls back on exception) when the connection is given back
+    async with pool.connection() as connection:
+        await connection.set_autocommit(autocommit)
+        yield connection
+
+
+@asynccontextmanager
+async def session():
+    """
+    Holds one connection of the driver set in settings.json (db.driver) for the duration of the
+    async with block, for the queries that rely on the session state (ie: temporary tables).
+
+    Yields:
+        A coroutine function running a query on that connection, same arguments as run_query().
+    """
+    if settings['db']['driver'] == 'async':
+        async with lease() as connection:
+            yield partial(execute_query, connection)
+    else:
+        with db.lease() as connection:
+            async def run(query, params=None, **kwargs):
+                return await asyncio.to_thread(db.execute_query, connection, query, params, **kwargs)
+            yield run
+
+
+async def check_pool():
+    """
+    Health check: makes sure a pooled connection can actually run a query.
+
+    Returns:
+        True if the database answered, False otherwise.
+    """
+    try:
+        async with lease() as connection:
+            cur = await connection.execute('SELECT 1')
+            return await cur.fetchone() == (1,)
+    except Exception as e:
+        logger.critical(f'Database health check failed: {e}')
+        return False
+
+
+async def close_pool():
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
+        logger.debug('Async connection pool closed')
+
+
+###################
+# Helper functions
+
+async def execute_query(connection, query, params=None, fetch=False, fetchone=False, do_raise=False):
+    if connection is None:
+        # No connection provided: lease one from the pool for this query only
+        async with lease() as connection:
+            return await execute_query(connection, query, params, fetch, fetchone, do_raise)
+
+    try:
+        async with connection.cursor() as cur:
+            await cur.execute(query, params)
+
+            if fetch:
+                return await cur.fetchall()
+            elif fetchone:
+                return await cur.fetchone()
+            else:
+                return True
+    except errors.UniqueViolation:
+        await connection.rollback()
+        if do_raise:
+            raise
+        return True
+    except Error as e:
+        logger.error(f'Database error: {e}')
+        await connection.rollback()
+        return None
+
+
+async def run_query(query, params=None, **kwargs):
+    """
+    Runs a single query from the event loop with the driver set in settings.json (db.driver):
+    on the async pool, or on the sync one in a thread so that browser pages keep going meanwhile.
+
+    Returns:
+        Same as execute_query().
+    """
+    if settings['db']['driver'] == 'async':
+        return await execute_query(None, query, params, **kwargs)
+    return await asyncio.to_thread(db.execute_query, None, query, params, **kwargs)
+
+
+def values_list(rows):
+    """
+    Builds a multi-row VALUES list, psycopg 3 has no execute_values().
+
+    Returns:
+        The placeholders to put after VALUES and the flattened parameters.
+    """
+    placeholders = ', '.join('(' + ', '.join(['%s'] * len(row)) + ')' for row in rows)
+    params = [value for row in rows for value in row]
+    return placeholders, params
+
+
+async def register_get_uid():
+    add_acc_query = 'INSERT INTO accounts (handle) VALUES (%s) RETURNING id'
+    async with lease() as connection:
+        res = await execute_query(connection, add_acc_query, (env.str('USERNAME'),), fetchone=True)
+
+        if res and type(res) == bool:
+            res = await execute_query(
+                connection,
+                'SELECT id FROM accounts WHERE handle = %s;',
+                (env.str('USERNAME'),),
+                fetchone=True
+            )
+            uid = res[0]
+        else:
+            logger.info(f'Added a new account into the accounts table')
+            uid = res[0]
+
+    return uid
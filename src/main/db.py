@@ -1,9 +1,11 @@
+from psycopg2 import sql, errors, Error, pool
+from contextlib import contextmanager
 from pathlib import Path
-from psycopg2 import sql, errors, Error
 from config import settings, env
 from tools.logger import logger
 from config import parse_args
 import subprocess
+import threading
 import platform
 import psycopg2
 import getpass
@@ -12,6 +14,9 @@ import re
 
 dev_mode: bool = True if parse_args().dev else False
 
+_pool = None # Connection pool to the pipeline database, created on first lease
+_pool_slots = None # Makes lease() wait for a free connection instead of failing when the pool is exhausted
+
 
 ###################
 # Helper functions
@@ -95,6 +100,11 @@ def pgsql_installed_by_brew(result):
 
 
 def execute_query(connection, query, params=None, fetch=False, fetchone=False, do_raise=False):
+    if connection is None:
+        # No connection provided: lease one from the pool for this query only
+        with lease() as connection:
+            return execute_query(connection, query, params, fetch, fetchone, do_raise)
+
     try:
         with connection.cursor() as cur:
             cur.execute(query, params)
@@ -201,6 +211,86 @@ def get_connection():
         return None
 
 
+######################
+# Connection pooling
+
+def get_pool():
+    """
+    Creates the connection pool to the pipeline database on first call.
+
+    Returns:
+        psycopg2 ThreadedConnectionPool, shared by the event loop and the load threads.
+    """
+    global _pool, _pool_slots
+    if _pool is None:
+        _pool = pool.ThreadedConnectionPool(
+            settings['db']['pool_min'],
+            settings['db']['pool_max'],
+            dbname=settings['db']['dbname'],
+            user=settings['db']['pipeline_user'],
+            password=get_db_password(),
+            host=get_host(),
+            port=settings['db']['port']
+        )
+        _pool_slots = threading.BoundedSemaphore(settings['db']['pool_max'])
+        logger.debug(f'Connection pool created ({settings["db"]["pool_min"]}-{settings["db"]["pool_max"]} connections)')
+    return _pool
+
+
+@contextmanager
+def lease(autocommit=True):
+    """
+    Borrows a connection from the pool for the duration of the with block.
+
+    Args:
+        autocommit (bool): Set to False to run the whole block in a single transaction,
+            committed when the block exits normally and rolled back otherwise.
+    """
+    connection_pool = get_pool()
+    _pool_slots.acquire()
+    connection = None
+    try:
+        connection = connection_pool.getconn()
+        connection.autocommit = autocommit
+        yield connection
+        if not autocommit:
+            connection.commit()
+    except Exception:
+        if connection is not None and not connection.closed and not autocommit:
+            connection.rollback()
+        raise
+    finally:
+        if connection is not None:
+            # Broken connections (ie: server restart) are dropped instead of going back to the pool
+            connection_pool.putconn(connection, close=bool(connection.closed))
+        _pool_slots.release()
+
+
+def check_pool():
+    """
+    Health check: makes sure a pooled connection can actually run a query.
+
+    Returns:
+        True if the database answered, False otherwise.
+    """
+    try:
+        with lease() as connection:
+            with connection.cursor() as cur:
+                cur.execute('SELECT 1')
+                return cur.fetchone() == (1,)
+    except Exception as e:
+        logger.critical(f'Database health check failed: {e}')
+        return False
+
+
+def close_pool():
+    global _pool
+    if _pool is not None:
+        _pool.closeall()
+        _pool = None
+        logger.debug('Connection pool closed')
+
+
 # Function to create the database
 def create_database():
     """
@@ -318,25 +408,26 @@ def grant_privileges():
 
 def register_get_uid():
     add_acc_query = 'INSERT INTO accounts (handle) VALUES (%s) RETURNING id'
-    res = execute_query(
-        get_connection(),
-        add_acc_query,
-        # The trailing comma after username is important so that Python understand it's in a tuple
-        (env.str('USERNAME'),),
-        fetchone=True
-    )
-
-    if res and type(res) == bool:
+    with lease() as connection:
         res = execute_query(
-            get_connection(),
-            'SELECT id FROM accounts WHERE handle = %s;',
+            connection,
+            add_acc_query,
+            # The trailing comma after username is important so that Python understand it's in a tuple
             (env.str('USERNAME'),),
             fetchone=True
         )
-        uid = res[0]
-    else:
-        logger.info(f'Added a new account into the accounts table')
-        uid = res[0]
+
+        if res and type(res) == bool:
+            res = execute_query(
+                connection,
+                'SELECT id FROM accounts WHERE handle = %s;',
+                (env.str('USERNAME'),),
+                fetchone=True
+            )
+            uid = res[0]
+        else:
+            logger.info(f'Added a new account into the accounts table')
+            uid = res[0]
 
     return uid
 
@@ -404,4 +495,34 @@ def setup_db():
             logger.critical('Failed to create actions table.')
             return False
 
+    with open(f'{src_dir}/sql/triage.sql', 'r') as f:
+        schema_sql = f.read()
+        if not execute_query(connection, schema_sql):
+            logger.critical('Failed to create triage table.')
+            return False
+
+    with open(f'{src_dir}/sql/extract_failures.sql', 'r') as f:
+        schema_sql = f.read()
+        if not execute_query(connection, schema_sql):
+            logger.critical('Failed to create extract_failures table.')
+            return False
+
+    with open(f'{src_dir}/sql/crawl_runs.sql', 'r') as f:
+        schema_sql = f.read()
+        if not execute_query(connection, schema_sql):
+            logger.critical('Failed to create crawl_runs table.')
+            return False
+
+    with open(f'{src_dir}/sql/crawl_frontier.sql', 'r') as f:
+        schema_sql = f.read()
+        if not execute_query(connection, schema_sql):
+            logger.critical('Failed to create crawl_frontier table.')
+            return False
+
+    with open(f'{src_dir}/sql/jobs.sql', 'r') as f:
+        schema_sql = f.read()
+        if not execute_query(connection, schema_sql):
+            logger.critical('Failed to create jobs table.')
+            return False
+
     return True
\ No newline at end of file
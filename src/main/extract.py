@@ -1,67 +1,299 @@
-from main.infra import enforce_login, AsyncBrowserManager, apply_concurrency_limit
+from main.infra import enforce_login, AsyncBrowserManager, AdaptiveLimiter
+from main.graphql import GRAPHQL_OPERATIONS, get_operation_name
 from playwright.async_api import TimeoutError as PlaywrightTimeoutError
-from classes.entities import UserExtract
+from contextlib import asynccontextmanager
+from classes.exceptions import RateLimitedError
+from classes.entities import UserExtract, FollowerCell
 from tools.logger import logger
-from bs4 import BeautifulSoup
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
 from config import settings
 import asyncio
 import random
+import time
 
 
-MAX_PARALLEL = settings['runtime']['max_parallel']
-semaphore = asyncio.Semaphore(MAX_PARALLEL) # Defined at module level to ensure all tasks use the same semaphore (limit count)
+src_dir = Path(__file__).resolve().parent.parent
+with open(f'{src_dir}/js/extract_profile.js', 'r') as f:
+    EXTRACT_PROFILE_JS = f.read() # Profile extractor run in the browser in evaluate mode
+with open(f'{src_dir}/js/settle_page.js', 'r') as f:
+    SETTLE_PAGE_JS = f.read()
+with open(f'{src_dir}/js/follower_cells.js', 'r') as f:
+    FOLLOWER_CELLS_JS = f.read() # Run on the rendered cells of the followers list
+with open(f'{src_dir}/js/collect_timeline.js', 'r') as f:
+    COLLECT_TIMELINE_JS = f.read() # Run at each step of the timeline scroller
 
+# Primary column of the profile without its posts, which are collected apart by the timeline scroller
+# The comment marks where to put them back
+PROFILE_HEADER_JS = """() => {
+    const column = document.querySelector('[data-testid="primaryColumn"]').cloneNode(true);
+    const region = column.querySelector('section[role="region"]');
+    region.querySelectorAll('article[data-testid="tweet"]').forEach(article => article.remove());
+    region.append(document.createComment('timeline'));
+    return column.outerHTML;
+}"""
 
-@apply_concurrency_limit(semaphore)
-async def get_user_data(handle):
+# Defined at module level to ensure all tasks use the same limiter, starts at runtime.max_parallel
+limiter = AdaptiveLimiter({**settings['concurrency'], 'initial': settings['runtime']['max_parallel']})
+
+
+###################
+# Helper functions
+
+@asynccontextmanager
+async def capture_graphql(page):
+    """Listen to the GraphQL responses of a page while in the block, navigate from inside it
+    Yields:
+        A dict of futures resolved with the JSON payload of each expected operation
+    """
+    loop = asyncio.get_running_loop()
+    captured = {operation: loop.create_future() for operation in GRAPHQL_OPERATIONS}
+
+    async def on_response(response):
+        future = captured.get(get_operation_name(response.url))
+        if future is None or future.done():
+            return
+        if response.status == 429:
+            future.set_exception(RateLimitedError())
+            return
+        try:
+            future.set_result(await response.json())
+        except Exception as e:
+            logger.debug(f'Unreadable GraphQL response {response.url}: {e}')
+
+    page.on('response', on_response)
+    try:
+        yield captured
+    finally:
+        # Pages are reused: don't let the listener pile up
+        page.remove_listener('response', on_response)
+
+
+async def settle_page(page, handle):
+    """Wait for the profile timeline to be rendered instead of sleeping for a fixed time
+    Returns once enough posts are displayed or the DOM stopped changing, with a hard cap,
+    then optionally waits a bit more to keep a human-like pace (settle.jitter)
+    Returns:
+        The seconds waited for the jitter
+    """
+    settle = settings['settle']
+    result = await page.evaluate(SETTLE_PAGE_JS, {
+        'minArticles': settle['min_articles'],
+        'quietMs': settle['quiet_ms'],
+        'maxWaitMs': settle['max_wait_ms']
+    })
+    logger.info(f'Settled {handle} in {result["elapsed"]} ms ({result["reason"]}, {result["articles"]} posts)')
+
+    jitter_min, jitter_max = settle['jitter']
+    jitter = random.uniform(jitter_min, jitter_max) if jitter_max else 0
+    if jitter:
+        await asyncio.sleep(jitter)
+    return jitter
+
+
+async def wait_graphql(captured, timeout):
+    """Wait for every expected GraphQL payload
+    Returns:
+        The payloads by operation name, or None if one of them didn't come in time
+    """
+    try:
+        await asyncio.wait_for(asyncio.gather(*captured.values()), timeout)
+        return {operation: future.result() for operation, future in captured.items()}
+    except asyncio.TimeoutError:
+        missing = [operation for operation, future in captured.items() if not future.done()]
+        logger.debug(f'GraphQL payloads missing: {", ".join(missing)}')
+        return None
+
+
+def past_timeline_limit(post, position, handle, newest_post_id, oldest_date):
+    """Tell if a post of the timeline scroller is already in DB or too old, same rules as transform.add_posts()
+    The first post can be a pinned one and reposts carry the ID of the original post: they don't tell anything
+    Returns:
+        True if past the limits, False for an own post within the limits, None for a post that doesn't tell
+    """
+    if not position or post['repost'] or post['author'] != handle:
+        return None
+    if newest_post_id and int(post['id']) <= newest_post_id:
+        return True
+    if oldest_date and post['timestamp']:
+        return datetime.fromisoformat(post['timestamp'].replace('Z', '+00:00')) < oldest_date
+    return False
+
+
+async def scroll_timeline(page, handle, newest_post_id=None):
+    """Scroll the timeline step by step and collect the posts as they get rendered (timeline settings)
+    Stops at timeline.max_posts posts, after timeline.stop_streak posts in a row that are already in DB or
+    older than timeline.max_age_days (a reply thread shows its older parent post above the new reply),
+    or when the timeline stops growing. Posts past those limits are left out
+    Returns:
+        The profile page HTML, reduced to the primary column and holding every collected post
+    """
+    timeline = settings['timeline']
+    pause_min, pause_max = timeline['scroll_pause']
+    oldest_date = None
+    if timeline['max_age_days']:
+        oldest_date = datetime.now(timezone.utc) - timedelta(days=timeline['max_age_days'])
+
+    # The header doesn't change while scrolling: get it once, without the posts
+    header_html = await page.evaluate(PROFILE_HEADER_JS)
+
+    posts_html = []
+    seen_ids = []
+    past_limit = 0 # Posts past the limits in a row
+    idle_count = 0
+    done = False
+    while not done and idle_count < timeline['idle_rounds']:
+        new_posts = await page.evaluate(COLLECT_TIMELINE_JS, {'seen': seen_ids})
+        for post in new_posts:
+            past = past_timeline_limit(post, len(seen_ids), handle, newest_post_id, oldest_date)
+            seen_ids.append(post['id'])
+            if past:
+                past_limit += 1
+                if past_limit >= timeline['stop_streak']:
+                    logger.debug(f'Timeline of {handle}: reached {past_limit} known or too old posts in a row')
+                    done = True
+                    break
+                continue
+            if past is False:
+                past_limit = 0
+
+            posts_html.append(post['html'])
+            if len(posts_html) >= timeline['max_posts']:
+                done = True
+                break
+
+        idle_count = 0 if new_posts else idle_count + 1
+        if not done:
+            await page.mouse.wheel(0, timeline['step'])
+            await asyncio.sleep(random.uniform(pause_min, pause_max))
+
+    logger.info(f'Collected {len(posts_html)} posts from the timeline of {handle}')
+    # Posts past the limits are left out: add_posts() has nothing to do with them
+    return header_html.replace('<!--timeline-->', ''.join(posts_html), 1)
+
+
+async def get_user_data(handle, newest_post_id=None):
+    """Extract the profile of a user, with retries
+    Callers must hold a slot of the limiter (async with limiter), see pipeline.extract_worker()
+    Returns:
+        A UserExtract instance, None if every attempt failed
+    """
     logger.debug(f'Extracting data from {handle}')
 
     max_retries = settings['runtime']['max_retries']
+    pool = AsyncBrowserManager.get_page_pool()
     for attempt in range(max_retries):
         try:
-            # Using one context per get_usr_data() call is lighter
-            # than instanciating one browser per call instead
-            page = await AsyncBrowserManager.get_new_page()
-            url = f'https://x.com/{handle}/with_replies'
-            await page.goto(url)
-
-            # Wait for one of the last elements of the page to load and THEN get the DOM
-            await page.wait_for_selector('section[role="region"]')
-            await asyncio.sleep(random.uniform(5, 6))
-            html = await page.content()
+            # Pages are leased from a pool of warm pages instead of opening a new tab for each
+            # profile, the page is replaced if the attempt fails
+            async with pool.page() as page:
+                user_extract, latency = await extract_profile(pool, page, handle, newest_post_id)
 
-            logger.debug(f'Done: {handle}')
-            return UserExtract(handle, html)
+            # Only how fast X served the page tells about throttling, not how long the timeline was scrolled
+            await limiter.record_success(latency)
+            logger.debug(f'Done: {handle} (concurrency limit: {limiter.limit})')
+            return user_extract
 
         except (PlaywrightTimeoutError, Exception) as e:
+                if isinstance(e, RateLimitedError):
+                    await limiter.record_failure('rate limited')
+                elif isinstance(e, PlaywrightTimeoutError):
+                    await limiter.record_failure('timeout')
+                else:
+                    await limiter.record_failure('failed attempt')
+
                 logger.warning(f'Attempt {attempt+1} failed for {handle}: {e}')
                 if attempt == max_retries - 1:
                     logger.error(f'Giving up on {handle} after {max_retries} attempts.')
                 else:
                     await asyncio.sleep(2 + attempt * 2)  # Exponential backoff
 
-        finally:
-            try:
-                await page.close()
-            except Exception:
-                pass
+
+async def extract_profile(pool, page, handle, newest_post_id=None):
+    """Load the profile of a user and extract its data according to the extraction mode
+    In HTML mode, the timeline can be scrolled to get more than the first posts (timeline.scroll)
+    Args:
+        newest_post_id: ID of the newest post of the user already in DB, the timeline scroller stops there
+    Returns:
+        (A UserExtract instance holding the HTML, the in-browser extracted fields or the GraphQL payloads,
+        seconds it took to load and settle the page: our own pauses and the timeline scrolling are left out)
+    """
+    start = time.monotonic()
+    mode = settings['extract']['mode']
+    url = f'https://x.com/{handle}/with_replies'
+    # The header of the new profile shows up once a soft navigation is over
+    ready_selector = f'a[href="/{handle}/following"]'
+
+    if mode == 'network':
+        async with capture_graphql(page) as captured:
+            await pool.navigate(page, url, ready_selector)
+
+            # The payloads come before anything gets rendered: no need to wait for the DOM
+            payloads = await wait_graphql(captured, settings['extract']['network_timeout'])
+        if payloads:
+            return UserExtract(handle, graphql=payloads), time.monotonic() - start
+        logger.debug(f'Falling back to HTML extraction for {handle}')
+    else:
+        await pool.navigate(page, url, ready_selector)
+
+    # Wait for one of the last elements of the page to load and THEN get the DOM
+    await page.wait_for_selector('section[role="region"]')
+    jitter = await settle_page(page, handle)
+    latency = time.monotonic() - start - jitter
+
+    if mode == 'evaluate':
+        # Extract the profile fields in the page and only get them back instead of the whole DOM
+        data = await page.evaluate(EXTRACT_PROFILE_JS, handle)
+        return UserExtract(handle, data=data), latency
+
+    if settings['timeline']['scroll']:
+        return UserExtract(handle, await scroll_timeline(page, handle, newest_post_id)), latency
+
+    html = await page.content()
+    return UserExtract(handle, html), latency
 
 
 @enforce_login
-async def get_user_handles():
-        page = AsyncBrowserManager.get_page()
-        # Here we use "first" because multiple elements can be returned w/ this selector
-        await page.locator('button[data-testid="UserCell"]').first.wait_for(timeout=10000)
-        html = await page.content()
-        soup = BeautifulSoup(html, 'html.parser')
-        followers_section = soup.find('section', attrs={'role': 'region'})
-        followers = followers_section.find_all(attrs={'data-testid': 'UserCell'})
-
-        user_handles: list[str] = []
-        # Get each follower's handle here
-        for follower in followers:
-            a_elem = follower.find('a', {'role':'link', 'aria-hidden': 'true'})
-            if a_elem.has_attr('href'):
-                user_handles.append(a_elem['href'][1:])
-
-        return user_handles
\ No newline at end of file
+async def get_follower_cells():
+    """Scroll the followers list and yield followers as soon as they get rendered
+    The list is virtualized (cells are recycled while scrolling) so handles are deduplicated here
+    Stops when the handle cap is reached or when the list stops growing for a few scroll rounds
+    Yields:
+        A FollowerCell for each newly discovered follower, with the profile fields its cell shows
+    """
+    page = AsyncBrowserManager.get_page()
+    max_handles = settings['followers']['max_handles']
+    idle_rounds = settings['followers']['idle_rounds']
+    pause_min, pause_max = settings['followers']['scroll_pause']
+
+    # Here we use "first" because multiple elements can be returned w/ this selector
+    await page.locator('button[data-testid="UserCell"]').first.wait_for(timeout=10000)
+
+    seen_handles: set[str] = set()
+    idle_count = 0
+
+    while idle_count < idle_rounds:
+        # Only read the fields of the rendered cells instead of serializing the whole DOM at each round
+        cells = await page.locator('section[role="region"] [data-testid="UserCell"]').evaluate_all(FOLLOWER_CELLS_JS)
+
+        new_count = 0
+        for cell in cells:
+            if not cell or cell['handle'] in seen_handles:
+                continue
+
+            seen_handles.add(cell['handle'])
+            new_count += 1
+            yield FollowerCell(**cell)
+
+            if max_handles and len(seen_handles) >= max_handles:
+                logger.info(f'Follower handle cap reached ({max_handles})')
+                return
+
+        # The list stopped growing if several scroll rounds in a row didn't render any new cell
+        idle_count = 0 if new_count else idle_count + 1
+        logger.debug(f'Followers list: {new_count} new handles, {len(seen_handles)} in total')
+
+        await page.mouse.wheel(0, 3000)
+        await asyncio.sleep(random.uniform(pause_min, pause_max))
+
+    logger.info(f'Followers list exhausted: {len(seen_handles)} handles found')
@@ -0,0 +1,132 @@
+from contextlib import asynccontextmanager
+from collections import namedtuple
+from tools.logger import logger
+import main.adb as adb
+
+
+# What is known about a harvested handle (see ADD_HARVESTED_QUERY)
+FollowerRow = namedtuple('FollowerRow', ['handle', 'age', 'follower', 'flagged', 'newest_post_id', 'failures'])
+
+
+# The handles harvested during the run, kept on the session of the FollowerDiff connection
+CREATE_HARVESTED_QUERY = """
+    DROP TABLE IF EXISTS harvested_followers;
+    CREATE TEMP TABLE harvested_followers (handle VARCHAR(255) PRIMARY KEY);
+"""
+
+DROP_HARVESTED_QUERY = 'DROP TABLE IF EXISTS harvested_followers'
+
+# Adds a chunk of harvested handles and looks them up against what is stored for the account
+# Several rows can share a handle (the unique key is handle + created_at): the latest one wins
+# A NULL age means the handle was never stored
+# newest_post_id is the high-water mark the transform stops at: reposts carry the id of the original post, skip them
+ADD_HARVESTED_QUERY = """
+    WITH added AS (
+        INSERT INTO harvested_followers (handle)
+        SELECT unnest(%s::varchar[])
+        ON CONFLICT DO NOTHING
+        RETURNING handle
+    )
+    SELECT
+        a.handle,
+        EXTRACT(EPOCH FROM LOCALTIMESTAMP - u.last_updated)::float AS age,
+        u.follower,
+        COALESCE(c.harmful OR c.inactive, FALSE) AS flagged,
+        (SELECT max(p.id) FROM posts p WHERE p.user_id = u.id AND NOT p.repost) AS newest_post_id,
+        COALESCE(f.failures, 0) AS failures
+    FROM added a
+    LEFT JOIN LATERAL (
+        SELECT id, last_updated, follower FROM users
+        WHERE account_id = %s AND handle = a.handle
+        ORDER BY last_updated DESC
+        LIMIT 1
+    ) u ON TRUE
+    LEFT JOIN classification c ON c.user_id = u.id
+    LEFT JOIN extract_failures f ON f.account_id = %s AND f.handle = a.handle
+"""
+
+# Followers of the last run missing from the harvested ones, only marked as departed if they are not
+# more than max_departed_ratio of them (a truncated followers list must not unfollow everyone)
+MARK_DEPARTED_QUERY = """
+    WITH previous AS (
+        SELECT id, handle FROM users WHERE account_id = %(uid)s AND follower
+    ), departed AS (
+        SELECT id FROM previous p
+        WHERE NOT EXISTS (SELECT 1 FROM harvested_followers h WHERE h.handle = p.handle)
+    ), marked AS (
+        UPDATE users SET follower = FALSE
+        WHERE id IN (SELECT id FROM departed)
+        AND (SELECT count(*) FROM departed) <= %(max_ratio)s * (SELECT count(*) FROM previous)
+        RETURNING id
+    )
+    SELECT (SELECT count(*) FROM departed), (SELECT count(*) FROM marked)
+"""
+
+
+class FollowerDiff:
+    """Tells the new, retained and departed followers apart, set-based:
+    harvested handles are loaded by chunks into a temporary table joined against the users of the account
+    """
+
+    def __init__(self, uid, run, max_departed_ratio):
+        self.uid = uid
+        self.run = run # Runs queries on the connection holding the temporary table
+        self.max_departed_ratio = max_departed_ratio
+        self.counts = {'new': 0, 'retained': 0, 'departed': 0}
+
+    async def add(self, handles):
+        """Add a chunk of harvested handles to the diff
+        Returns:
+            A FollowerRow for each handle, in harvest order
+        """
+        if not handles:
+            return []
+
+        rows = await self.run(ADD_HARVESTED_QUERY, (list(handles), self.uid, self.uid), fetch=True)
+        if rows is None:
+            logger.warning(f'Follower diff failed for {len(handles)} handles, considering them new')
+            rows = [(handle, None, None, False, None, 0) for handle in handles]
+        rows = [FollowerRow(*row) for row in rows]
+
+        for row in rows:
+            self.counts['retained' if row.follower else 'new'] += 1
+
+        order = {handle: i for i, handle in enumerate(handles)}
+        return sorted(rows, key=lambda row: order[row.handle])
+
+    async def mark_departed(self):
+        """Clear the follower flag of the users missing from the harvested handles
+        Only call once the whole followers list was harvested
+        """
+        res = await self.run(
+            MARK_DEPARTED_QUERY, {'uid': self.uid, 'max_ratio': self.max_departed_ratio}, fetchone=True
+        )
+        if not res:
+            logger.error('Unable to mark the departed followers')
+            return
+
+        departed, marked = res
+        self.counts['departed'] = marked
+        if departed and not marked:
+            logger.warning(
+                f'{departed} followers missing from the list, more than {self.max_departed_ratio:.0%} '
+                'of them: not marking them as departed'
+            )
+
+    def log_stats(self):
+        logger.info(
+            f'Followers: {self.counts["new"]} new, {self.counts["retained"]} retained, '
+            f'{self.counts["departed"]} departed'
+        )
+
+
+@asynccontextmanager
+async def follower_diff(uid, max_departed_ratio):
+    """Open a FollowerDiff on its own connection for the duration of the async with block"""
+    async with adb.session() as run:
+        await run(CREATE_HARVESTED_QUERY)
+        try:
+            yield FollowerDiff(uid, run, max_departed_ratio)
+        finally:
+            # The connection goes back to the pool: don't leave the handles behind
+            await run(DROP_HARVESTED_QUERY)
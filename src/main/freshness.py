@@ -0,0 +1,50 @@
+from collections import Counter
+from tools.logger import logger
+
+
+class FreshnessPolicy:
+    """Skips the followers refreshed recently enough, based on users.last_updated
+    Each bucket has its own TTL, configured in settings.json (freshness.ttl_hours):
+    - new: not a follower at the last refresh (never stored followers are always extracted)
+    - flagged: classified as harmful or inactive
+    - default: everyone else
+    """
+
+    def __init__(self, freshness_settings):
+        self.enabled = freshness_settings['enabled']
+        self.ttl = {bucket: hours * 3600 for bucket, hours in freshness_settings['ttl_hours'].items()}
+        self.skipped = Counter()
+
+    @staticmethod
+    def get_bucket(follower, flagged):
+        if flagged:
+            return 'flagged'
+        return 'default' if follower else 'new'
+
+    def is_fresh(self, age, follower, flagged):
+        if age is None: # Never stored
+            return False
+        return age < self.ttl[self.get_bucket(follower, flagged)]
+
+    def select_stale(self, rows):
+        """Keep the handles to extract out of a chunk of looked up handles
+        Args:
+            rows: The FollowerRow of each handle, the age is in seconds since the last refresh
+        Returns:
+            The rows of the handles to extract
+        """
+        if not self.enabled:
+            return rows
+
+        stale = []
+        for row in rows:
+            if self.is_fresh(row.age, row.follower, row.flagged):
+                self.skipped[self.get_bucket(row.follower, row.flagged)] += 1
+            else:
+                stale.append(row)
+        return stale
+
+    def log_stats(self):
+        if self.skipped:
+            details = ', '.join(f'{count} {bucket}' for bucket, count in self.skipped.items())
+            logger.info(f'Skipped {sum(self.skipped.values())} recently refreshed followers ({details})')
@@ -0,0 +1,141 @@
+from main.adb import run_query, values_list
+from main.followers import FollowerRow
+from tools.logger import logger
+import asyncio
+
+
+FRONTIER_STATES = ('pending', 'in_flight', 'done', 'failed')
+
+CREATE_RUN_QUERY = 'INSERT INTO crawl_runs (account_id) VALUES (%s) RETURNING id'
+
+LAST_RUN_QUERY = """
+    SELECT id, harvested_at IS NOT NULL FROM crawl_runs
+    WHERE account_id = %s AND finished_at IS NULL
+    ORDER BY started_at DESC
+    LIMIT 1
+"""
+
+# In-flight handles were lost with the crashed run: they go back to the scheduler too
+RESUME_QUERY = """
+    SELECT handle, age, follower, flagged, newest_post_id, failures FROM crawl_frontier
+    WHERE run_id = %s AND state IN ('pending', 'in_flight')
+"""
+
+FRONTIER_UPSERT_QUERY = """
+    INSERT INTO crawl_frontier (
+        run_id, handle, state, age, follower, flagged, newest_post_id, failures
+    ) VALUES {values}
+    ON CONFLICT (run_id, handle) DO UPDATE SET
+        state = EXCLUDED.state,
+        updated_at = NOW()
+"""
+
+HARVESTED_QUERY = 'UPDATE crawl_runs SET harvested_at = NOW() WHERE id = %s'
+FINISH_QUERY = 'UPDATE crawl_runs SET finished_at = NOW() WHERE id = %s'
+
+
+class Frontier:
+    """Checkpoint of the crawl: the state of each handle selected for extraction, per account and run
+    State changes are buffered and written by batches (checkpoint settings), not one query per handle
+    so that a crash loses at most checkpoint.flush_interval seconds of progress
+    """
+
+    def __init__(self, uid, checkpoint_settings):
+        self.uid = uid
+        self.batch_size = checkpoint_settings['batch_size']
+        self.flush_interval = checkpoint_settings['flush_interval']
+        self.run_id = None
+        self.rows = {} # FollowerRow of each handle of the frontier
+        self.pending_writes = {} # Latest state of each handle since the last flush
+        self.full = asyncio.Event()
+        self.lock = asyncio.Lock()
+        self.flusher = None
+        self.closing = False
+
+    async def open(self, resume=False):
+        """Start a new run, or continue the last unfinished one of the account
+        Returns:
+            (FollowerRow of the handles left to extract, True if the followers list was fully harvested)
+        """
+        if resume:
+            res = await run_query(LAST_RUN_QUERY, (self.uid,), fetchone=True)
+            if res:
+                self.run_id, harvested = res
+                rows = [FollowerRow(*row) for row in await run_query(RESUME_QUERY, (self.run_id,), fetch=True) or []]
+                self.rows.update((row.handle, row) for row in rows)
+                logger.info(f'Resuming run {self.run_id}: {len(rows)} handles left')
+                self.flusher = asyncio.create_task(self.flush_loop())
+                return rows, harvested
+            logger.info('No unfinished run to resume, starting a new one')
+
+        res = await run_query(CREATE_RUN_QUERY, (self.uid,), fetchone=True)
+        if not res:
+            logger.error('Unable to create a crawl run: progress will not be saved')
+        else:
+            self.run_id = res[0]
+        self.flusher = asyncio.create_task(self.flush_loop())
+        return [], False
+
+    def add(self, rows):
+        """Add selected handles to the frontier
+        Returns:
+            The rows of the handles that weren't in the frontier yet (ie: already selected before a resume)
+        """
+        added = [row for row in rows if row.handle not in self.rows]
+        for row in added:
+            self.rows[row.handle] = row
+            self.mark(row.handle, 'pending')
+        return added
+
+    def mark(self, handle, state):
+        if handle not in self.rows:
+            return
+        self.pending_writes[handle] = state
+        if len(self.pending_writes) >= self.batch_size:
+            self.full.set()
+
+    async def flush(self):
+        async with self.lock:
+            if not self.pending_writes or self.run_id is None:
+                return
+            writes, self.pending_writes = self.pending_writes, {}
+
+            rows = [
+                (self.run_id, handle, state, *self.rows[handle][1:])
+                for handle, state in writes.items()
+            ]
+            placeholders, params = values_list(rows)
+            if not await run_query(FRONTIER_UPSERT_QUERY.format(values=placeholders), params):
+                logger.error(f'Unable to checkpoint {len(rows)} handles')
+                # Keep them for the next flush, unless a newer state came meanwhile
+                self.pending_writes = {**writes, **self.pending_writes}
+
+    async def flush_loop(self):
+        while not self.closing:
+            try:
+                await asyncio.wait_for(self.full.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self.full.clear()
+            await self.flush()
+
+    async def set_harvested(self):
+        """Record that the followers list was fully harvested: a resume doesn't scroll it again"""
+        await self.flush()
+        if self.run_id is not None:
+            await run_query(HARVESTED_QUERY, (self.run_id,))
+
+    async def close(self, finished):
+        """Write the remaining state changes
+        Args:
+            finished: True if every handle of the frontier was processed: the run can't be resumed anymore
+        """
+        if self.flusher:
+            # Not cancelled: a flush cut short would lose its writes, or leave one running that could land
+            # after the last flush and overwrite newer states
+            self.closing = True
+            self.full.set()
+            await asyncio.gather(self.flusher, return_exceptions=True)
+        await self.flush()
+        if finished and self.run_id is not None:
+            await run_query(FINISH_QUERY, (self.run_id,))
@@ -0,0 +1,146 @@
+from urllib.parse import urlparse
+from datetime import datetime
+
+
+# GraphQL operations fetched by X when loading a /with_replies profile page
+USER_OPERATION = 'UserByScreenName'
+TIMELINE_OPERATION = 'UserTweetsAndReplies'
+GRAPHQL_OPERATIONS = (USER_OPERATION, TIMELINE_OPERATION)
+
+TWITTER_DATE_FORMAT = '%a %b %d %H:%M:%S %z %Y' # ie: 'Wed Mar 04 12:00:00 +0000 2015'
+
+
+###################
+# Helper functions
+
+def get_operation_name(url):
+    """Get the operation name out of a GraphQL endpoint URL
+    ie: https://x.com/i/api/graphql/<query_id>/UserByScreenName?variables=... => UserByScreenName
+    Returns:
+        The operation name, or None if the URL is not a GraphQL endpoint
+    """
+    path = urlparse(url).path.split('/')
+    if 'graphql' not in path:
+        return None
+    return path[-1]
+
+
+def parse_date(date_str):
+    return datetime.strptime(date_str, TWITTER_DATE_FORMAT)
+
+
+def to_display_count(count):
+    """Format a count the way X displays it on profiles (ie: 1,234 / 56.7K / 1.5M)"""
+    if count < 10000:
+        return f'{count:,}'
+
+    for divider, suffix in ((1000000, 'M'), (1000, 'K')):
+        if count >= divider:
+            # X truncates instead of rounding, and drops the trailing .0
+            value = int(count * 10 / divider) / 10
+            return f'{value:g}{suffix}'
+
+
+def unwrap_result(result):
+    """Tweets with visibility restrictions are nested one level deeper than the other ones"""
+    if result and result.get('__typename') == 'TweetWithVisibilityResults':
+        return result.get('tweet')
+    return result
+
+
+def get_user_core(user_result):
+    """Name and handle of a user result: moved from 'legacy' to 'core' in recent payloads"""
+    legacy = user_result.get('legacy', {})
+    core = user_result.get('core', {})
+    return {
+        'name': core.get('name', legacy.get('name')),
+        'screen_name': core.get('screen_name', legacy.get('screen_name')),
+        'created_at': core.get('created_at', legacy.get('created_at'))
+    }
+
+
+##################
+# Payload parsing
+
+def get_user_fields(payload):
+    """Get the profile fields out of a UserByScreenName payload
+    Returns:
+        A dict of profile fields, or None if the payload doesn't hold any user
+    """
+    user_result = ((payload or {}).get('data', {}).get('user') or {}).get('result')
+    if not user_result or user_result.get('__typename') != 'User':
+        return None
+
+    legacy = user_result['legacy']
+    core = get_user_core(user_result)
+    url_entities = legacy.get('entities', {}).get('url', {}).get('urls', [])
+
+    return {
+        'handle': core['screen_name'],
+        'username': core['name'],
+        'certified': bool(user_result.get('is_blue_verified') or legacy.get('verified')),
+        'bio': legacy.get('description') or None,
+        'created_at': parse_date(core['created_at']),
+        'following_count': legacy['friends_count'],
+        'followers_count': legacy['followers_count'],
+        'url': url_entities[0].get('display_url') if url_entities else None
+    }
+
+
+def get_timeline_tweets(payload):
+    """Walk a UserTweetsAndReplies payload and yield the tweets in display order (pinned tweet first)"""
+    user_result = ((payload or {}).get('data', {}).get('user') or {}).get('result', {})
+    # The timeline key changed over time, support both
+    timeline = user_result.get('timeline_v2', user_result.get('timeline', {})).get('timeline', {})
+
+    entries = []
+    for instruction in timeline.get('instructions', []):
+        if instruction.get('type') == 'TimelinePinEntry':
+            entries.insert(0, instruction['entry'])
+        elif instruction.get('type') == 'TimelineAddEntries':
+            entries.extend(instruction['entries'])
+
+    for entry in entries:
+        content = entry.get('content', {})
+        # Conversations (replies) are modules holding several tweets, regular tweets are single items
+        items = [item.get('item', {}).get('itemContent', {}) for item in content.get('items', [])]
+        if content.get('itemContent'):
+            items.append(content['itemContent'])
+
+        for item_content in items:
+            if item_content.get('itemType') != 'TimelineTweet':
+                continue # Cursors, who-to-follow modules...
+
+            tweet = unwrap_result(item_content.get('tweet_results', {}).get('result'))
+            if tweet and tweet.get('__typename') == 'Tweet':
+                yield tweet
+
+
+def get_post_fields(tweet):
+    """Get the post fields out of a timeline tweet, in the format get_post_from_json() expects
+    Same meaning as on the rendered page: a repost is represented by the original post, flagged as reposted
+    """
+    reposted_result = tweet['legacy'].get('retweeted_status_result')
+    repost = reposted_result is not None
+    if repost:
+        tweet = unwrap_result(reposted_result['result'])
+
+    legacy = tweet['legacy']
+    author = get_user_core(tweet['core']['user_results']['result'])
+
+    return {
+        'id': tweet['rest_id'],
+        'handle': author['screen_name'],
+        'username': author['name'],
+        # Same format as the datetime attribute of the <time> tags
+        'timestamp': parse_date(legacy['created_at']).strftime('%Y-%m-%dT%H:%M:%S.000Z'),
+        'text': legacy.get('full_text') or None,
+        # Same order as the interaction counters displayed under each post
+        'stats': [
+            str(legacy.get('reply_count', 0)),
+            str(legacy.get('retweet_count', 0)),
+            str(legacy.get('favorite_count', 0)),
+            str(tweet.get('views', {}).get('count', 0))
+        ],
+        'repost': repost
+    }
@@ -1,9 +1,16 @@
 from playwright.async_api import async_playwright
-from classes.exceptions import NotLoggedInError
+from classes.exceptions import NotLoggedInError, RateLimitedError
 from tools.logger import logger
+from contextlib import asynccontextmanager
+from collections import Counter
 from functools import wraps
-from config import env
-import traceback
+from urllib.parse import urlparse
+from config import env, settings
+import tempfile
+import fnmatch
+import shutil
+import time
+import inspect
 import asyncio
 import random
 
@@ -11,14 +18,231 @@ import random
 #################
 # App state mgmt
 
+class ResourcePolicy:
+    """Aborts the requests we don't need to read profiles (images, videos, fonts, trackers...)
+    Installed as a route on the whole browser context, configured in settings.json (resources)
+    """
+
+    def __init__(self, resource_settings):
+        self.block_types = set(resource_settings['block_types'])
+        self.block_patterns = resource_settings['block_patterns']
+        self.allow_patterns = resource_settings['allow_patterns']
+        self.estimated_bytes = resource_settings['estimated_bytes']
+        self.blocked = Counter()
+        self.allowed = 0
+
+    @staticmethod
+    def matches(url, patterns):
+        return any(fnmatch.fnmatch(url, pattern) for pattern in patterns)
+
+    @staticmethod
+    def on_login_page(request):
+        # Never get in the way of the login flow: everything requested from its pages goes through
+        try:
+            page_url = request.frame.url
+        except Exception: # Service workers requests don't have any frame
+            return False
+        # Same paths as the login check: handles or posts mentioning "login" or "flow" still get blocked
+        return urlparse(page_url).path.startswith(AsyncBrowserManager.LOGIN_PATHS)
+
+    def should_block(self, request):
+        if self.matches(request.url, self.allow_patterns) or self.on_login_page(request):
+            return False
+        return request.resource_type in self.block_types or self.matches(request.url, self.block_patterns)
+
+    async def handle(self, route):
+        request = route.request
+        if self.should_block(request):
+            self.blocked[request.resource_type] += 1
+            await route.abort('blockedbyclient')
+        else:
+            self.allowed += 1
+            await route.fallback()
+
+    def saved_bytes(self):
+        """Blocked responses are never downloaded: their size is estimated from per-type averages"""
+        return sum(
+            count * self.estimated_bytes.get(resource_type, self.estimated_bytes['other'])
+            for resource_type, count in self.blocked.items()
+        )
+
+    def log_stats(self):
+        blocked_count = sum(self.blocked.values())
+        details = ', '.join(f'{resource_type}: {count}' for resource_type, count in self.blocked.most_common())
+        logger.info(
+            f'Resource policy: blocked {blocked_count} requests out of {blocked_count + self.allowed} '
+            f'(~{self.saved_bytes() / 1e6:.1f} MB saved) {f"- {details}" if details else ""}'
+        )
+
+    def reset(self):
+        self.blocked.clear()
+        self.allowed = 0
+
+
+class PagePool:
+    """Warm pages reused from one profile extraction to the next instead of opening a tab each time
+    Pages are replaced after an error or after max_uses navigations, to keep their JS heap in check
+    Leases are spread across the browser instances: each one goes to the instance with the fewest leased pages
+    """
+
+    def __init__(self, size, max_uses, soft_navigation):
+        self.size = size
+        self.max_uses = max_uses
+        self.soft_navigation = soft_navigation
+        self.slots = asyncio.Semaphore(size) # One slot per page leased at the same time
+        self.idle = [] # Released pages, ready for the next lease
+        self.uses = {} # Navigations count of each page currently in the pool
+        self.shards = {} # Browser instance of each page currently in the pool
+        self.leased = Counter() # Leased pages count of each browser instance
+
+    async def acquire(self):
+        await self.slots.acquire()
+        try:
+            page = await self.lease_page()
+        except BaseException:
+            self.slots.release()
+            raise
+        self.leased[self.shards[page]] += 1
+        return page
+
+    async def lease_page(self):
+        # Least-loaded dispatch: ties go to an instance that has an idle page to reuse
+        idle_shards = {self.shards[page] for page in self.idle}
+        shard = min(
+            AsyncBrowserManager.get_shards(),
+            key=lambda shard: (self.leased[shard], shard not in idle_shards)
+        )
+        for page in reversed(self.idle):
+            if self.shards[page] is shard:
+                self.idle.remove(page)
+                return page
+
+        # The pool is full of idle pages of busier instances: make room on the least loaded one
+        if len(self.uses) >= self.size and self.idle:
+            await self.discard(self.idle.pop(0))
+
+        page = await AsyncBrowserManager.get_new_page(shard)
+        self.uses[page] = 0
+        self.shards[page] = shard
+        return page
+
+    async def release(self, page, failed=False):
+        self.leased[self.shards.get(page)] -= 1
+        try:
+            if failed or self.uses.get(page, 0) >= self.max_uses:
+                # The next lease will open a fresh page instead
+                await self.discard(page)
+            else:
+                await self.reset(page)
+                self.idle.append(page)
+        except Exception:
+            await self.discard(page)
+        finally:
+            self.slots.release()
+
+    async def reset(self, page):
+        # Soft navigations keep the document: don't start the next profile where the last one was scrolled to
+        # Event listeners are removed by whoever registered them
+        if self.soft_navigation:
+            await page.evaluate('window.scrollTo(0, 0)')
+
+    async def discard(self, page):
+        self.uses.pop(page, None)
+        self.shards.pop(page, None)
+        try:
+            await page.close()
+        except Exception:
+            pass
+
+    @asynccontextmanager
+    async def page(self):
+        """Lease a page: it is released when leaving the block, and replaced if an exception was raised"""
+        page = await self.acquire()
+        try:
+            yield page
+        except BaseException:
+            await self.release(page, failed=True)
+            raise
+        await self.release(page)
+
+    async def navigate(self, page, url, ready_selector=None):
+        """Go to url, through the X app router when soft navigation is enabled
+        A soft navigation keeps the booted app (no document reload), ready_selector is then used to
+        wait for the new content, as the previous one stays displayed until the new route renders
+        """
+        self.uses[page] = self.uses.get(page, 0) + 1
+        if self.soft_navigation and page.url.startswith('https://x.com/'):
+            path = url.removeprefix('https://x.com')
+            await page.evaluate(
+                """path => {
+                    history.pushState({}, '', path);
+                    window.dispatchEvent(new PopStateEvent('popstate', { state: {} }));
+                }""",
+                path
+            )
+            if ready_selector:
+                await page.wait_for_selector(ready_selector)
+        else:
+            response = await page.goto(url)
+            if response and response.status == 429:
+                raise RateLimitedError()
+
+
+class BrowserShard:
+    """One Firefox instance (persistent context) of the browser manager
+    Instances other than the first one run on a copy of the FFPROFILEPATH profile: they start with its session
+    """
+
+    # Firefox refuses to open a profile whose lock files are present, caches are rebuilt on their own
+    CLONE_IGNORE = shutil.ignore_patterns('lock', '.parentlock', 'parent.lock', 'cache2', 'startupCache')
+
+    def __init__(self, index, profile_path, cloned=False):
+        self.index = index
+        self.profile_path = profile_path
+        self.cloned = cloned
+        self.context = None
+
+    @classmethod
+    def clone(cls, index, source_path, clone_dir=None):
+        profile_path = tempfile.mkdtemp(prefix=f'watchdxg-profile-{index}-', dir=clone_dir)
+        shutil.copytree(source_path, profile_path, ignore=cls.CLONE_IGNORE, dirs_exist_ok=True)
+        return cls(index, profile_path, cloned=True)
+
+    async def start(self, playwright, headless, resource_policy=None):
+        self.context = await playwright.firefox.launch_persistent_context(
+            user_data_dir=self.profile_path,
+            headless=headless,
+            viewport={'width': 1920, 'height': 2000},
+            user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:119.0) Gecko/20100101 Firefox/119.0'
+        )
+        # Applies to every page of the context, including the ones opened later
+        if resource_policy:
+            await self.context.route('**/*', resource_policy.handle)
+
+    async def new_page(self):
+        return await self.context.new_page()
+
+    def remove_clone(self):
+        if self.cloned:
+            shutil.rmtree(self.profile_path, ignore_errors=True)
+
+
 class AsyncBrowserManager:
     # Class-level variables to store the singleton instance, browser context, and processing state
+    # _browser and _page belong to the first browser instance, the one used for the login and the followers list
     _instance = None
     _browser = None
     _context = None
     _page = None
+    _shards = []
     _ready = False
     _headless = True
+    _resource_policy = None
+    _page_pool = None
+    _login_checked_at = None # When logged_in() last succeeded, None if the session may have been lost
+
+    # Pages X redirects to when the session is gone
+    LOGIN_PATHS = ('/login', '/logout', '/i/flow')
 
     def __new__(cls):
         """
@@ -44,13 +268,23 @@ class AsyncBrowserManager:
         try:
             cls._playwright = await async_playwright().start()
 
-            # Launch the browser (not persistent)
-            cls._browser = await cls._playwright.firefox.launch_persistent_context(
-                user_data_dir=env.str('FFPROFILEPATH'),
-                headless=cls._headless,
-                viewport={'width': 1920, 'height': 2000},
-                user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:119.0) Gecko/20100101 Firefox/119.0'
-            )
+            # Profiles are copied before any instance starts writing to the original one
+            profile_path = env.str('FFPROFILEPATH')
+            cls._shards = [BrowserShard(0, profile_path)] + [
+                BrowserShard.clone(index, profile_path, settings['browsers']['clone_dir'])
+                for index in range(1, settings['browsers']['instances'])
+            ]
+
+            if settings['resources']['block']:
+                cls._resource_policy = ResourcePolicy(settings['resources'])
+
+            # One Firefox process per instance, launched side by side
+            await asyncio.gather(*(
+                shard.start(cls._playwright, cls._headless, cls._resource_policy) for shard in cls._shards
+            ))
+            cls._browser = cls._shards[0].context
+            for shard in cls._shards:
+                cls.watch_login(shard.context)
 
             cls._page = cls._browser.pages[0] if cls._browser.pages else await cls._browser.new_page()
 
@@ -61,7 +295,7 @@ class AsyncBrowserManager:
             await cls._page.wait_for_selector('header[role="banner"]', timeout=8000)
 
             cls._ready = True
-            logger.info('BrowserManager ready')
+            logger.info(f'BrowserManager ready ({len(cls._shards)} browser instances)')
 
         except Exception as e:
             logger.error(f'Something went wrong during Browser initialization: {e}')
@@ -86,11 +320,69 @@ class AsyncBrowserManager:
         return cls._page
 
     @classmethod
-    async def get_new_page(cls):
-        return await cls._browser.new_page()
+    def get_shards(cls):
+        return cls._shards
+
+    @classmethod
+    async def get_new_page(cls, shard=None):
+        """Open a page on the given browser instance, by default on the one with the fewest pages open"""
+        if shard is None:
+            shard = min(cls._shards, key=lambda shard: len(shard.context.pages))
+        return await shard.new_page()
+
+    @classmethod
+    async def share_session(cls):
+        """Copy the cookies of the first instance to the others, after a login made on it"""
+        cookies = await cls._browser.cookies()
+        for shard in cls._shards[1:]:
+            await shard.context.add_cookies(cookies)
+
+    @classmethod
+    def get_page_pool(cls):
+        # Sized after the extraction concurrency: one page per concurrent get_user_data() call
+        if cls._page_pool is None:
+            cls._page_pool = PagePool(
+                settings['concurrency']['max'],
+                settings['pages']['max_uses'],
+                settings['pages']['soft_navigation']
+            )
+        return cls._page_pool
+
+    @classmethod
+    def watch_login(cls, context):
+        """Forget the login check as soon as any page of the context lands on a login page"""
+        def on_navigated(frame):
+            if frame.parent_frame is None and urlparse(frame.url).path.startswith(cls.LOGIN_PATHS):
+                logger.debug(f'Login page reached ({frame.url}): the session will be checked again')
+                cls._login_checked_at = None
+
+        def watch_page(page):
+            page.on('framenavigated', on_navigated)
+
+        for page in context.pages:
+            watch_page(page)
+        context.on('page', watch_page)
+
+    @classmethod
+    async def login_cached(cls):
+        """Cheap login check: the last successful check is recent enough and the auth cookie is still there
+        Returns:
+            True if logged_in() can be skipped
+        """
+        login_settings = settings['login']
+        if cls._login_checked_at is None or time.monotonic() - cls._login_checked_at > login_settings['cache_ttl']:
+            return False
+
+        cookies = await cls._browser.cookies('https://x.com')
+        if not any(cookie['name'] == login_settings['auth_cookie'] for cookie in cookies):
+            logger.debug('Auth cookie missing: the session will be checked again')
+            cls._login_checked_at = None
+            return False
+        return True
 
     @classmethod
     async def logged_in(cls):
+        cls._login_checked_at = None
         try:
             logger.debug('Checking login state...')
             # Wait for the page to load properly and stabilize after login
@@ -107,6 +399,7 @@ class AsyncBrowserManager:
             else:
                 logger.debug('Navigation bar is present - loggin successful')
 
+            cls._login_checked_at = time.monotonic()
             return True
 
         except TimeoutError:
@@ -117,63 +410,168 @@ class AsyncBrowserManager:
             logger.debug(f'Unexpected error during login check: {e}')
             return False
 
+    @classmethod
+    def log_resource_stats(cls):
+        """Log the resource policy counts since the last call"""
+        if cls._resource_policy:
+            cls._resource_policy.log_stats()
+            cls._resource_policy.reset()
+
     @classmethod
     async def close(cls):
+        cls.log_resource_stats()
         if cls._browser:
             await cls._playwright.stop()
             cls._instance = None
+            cls._page_pool = None
+            cls._login_checked_at = None
+        for shard in cls._shards:
+            shard.remove_clone()
+        cls._shards = []
+
+
+######################
+# Concurrency control
+
+class AdaptiveLimiter:
+    """Concurrency limit adjusted to how X responds (AIMD), usable like a semaphore (async with)
+    The limit grows by one after a full window of fast, successful calls, and is cut by the backoff
+    factor as soon as timeouts, rate limits or slow pages show up
+    """
+
+    def __init__(self, concurrency_settings):
+        self.min = concurrency_settings['min']
+        self.max = concurrency_settings['max']
+        self.limit = min(max(concurrency_settings['initial'], self.min), self.max)
+        self.latency_target = concurrency_settings['latency_target']
+        self.backoff = concurrency_settings['backoff']
+        self.cooldown = concurrency_settings['cooldown']
+        self.in_flight = 0
+        self.successes = 0 # Healthy calls since the last limit change
+        self.last_decrease = 0
+        self.condition = asyncio.Condition()
+
+    async def __aenter__(self):
+        async with self.condition:
+            await self.condition.wait_for(lambda: self.in_flight < self.limit)
+            self.in_flight += 1
+        return self
+
+    async def __aexit__(self, *exc_info):
+        async with self.condition:
+            self.in_flight -= 1
+            self.condition.notify_all()
+
+    async def record_success(self, latency):
+        if self.on_success(latency):
+            await self.notify()
+
+    async def record_failure(self, reason):
+        if self.decrease(reason):
+            await self.notify()
+
+    def on_success(self, latency):
+        """
+        Returns:
+            True if the limit changed
+        """
+        # A slow page is the first sign of X throttling us
+        if latency > self.latency_target:
+            return self.decrease(f'slow page: {latency:.1f}s')
+
+        self.successes += 1
+        # One increase per window of healthy calls, the window being as wide as the current limit
+        if self.successes >= self.limit and self.limit < self.max:
+            return self.set_limit(self.limit + 1, 'healthy')
+        return False
+
+    def decrease(self, reason):
+        # Failures of the calls started before the previous decrease are already accounted for
+        now = time.monotonic()
+        if now - self.last_decrease < self.cooldown:
+            return False
+        self.last_decrease = now
+        return self.set_limit(max(self.min, int(self.limit * self.backoff)), reason)
+
+    def set_limit(self, limit, reason):
+        self.successes = 0
+        if limit == self.limit:
+            return False
+        logger.info(f'Concurrency limit: {self.limit} -> {limit} ({reason})')
+        self.limit = limit
+        return True
+
+    async def notify(self):
+        # Wake up the waiting calls so that they see the new limit
+        async with self.condition:
+            self.condition.notify_all()
 
 
 ##################
 # Decorators zone
 
 
-def apply_concurrency_limit(semaphore):
-    def decorator(func): # <= Doesn't need to be async
+# Decorator function: when you don't need to pass custom parameters
+def enforce_login(func):
+    # Async generators can't be awaited, they are iterated: they need their own wrapper
+    if inspect.isasyncgenfunction(func):
         @wraps(func)
-        async def wrapper(*args, **kwargs):
-            async with semaphore:
-                try:
-                    return await func(*args, **kwargs)
-                except Exception as e:
-                    logger.critical(f'Exception in {func.__name__}({args}, {kwargs}):\n{traceback.format_exc()}')
-        return wrapper
-    return decorator
+        async def gen_wrapper(*args, **kwargs):
+            logger.debug('Decorator: Entered enforce_login wrapper')
+            if not await ensure_login():
+                return
 
+            async for item in func(*args, **kwargs):
+                yield item
+        return gen_wrapper
 
-# Decorator function: when you don't need to pass custom parameters
-def enforce_login(func):
     @wraps(func)
     async def wrapper(*args, **kwargs):
         logger.debug('Decorator: Entered enforce_login wrapper')
+        if not await ensure_login():
+            return
 
-        if not AsyncBrowserManager.ready():
-            await AsyncBrowserManager.init()
-            logger.debug('Decorator: Initialized browser manager')
+        return await func(*args, **kwargs)
+    return wrapper
 
-        try:
-            logger.debug('Decorator: Checking if logged in...')
-            if await AsyncBrowserManager.logged_in():
-                logger.debug('Decorator: Already logged in, calling wrapped function')
-                return await func(*args, **kwargs)
-            else:
-                logger.debug('Decorator: Not logged in, attempting login...')
-                await login(AsyncBrowserManager.get_page())
-                logger.debug('Decorator: Login attempted')
 
-                if not await AsyncBrowserManager.logged_in():
-                    raise NotLoggedInError('Login attempt failed')
+async def ensure_login():
+    """Initialize the browser manager if needed and make sure we're logged in on X
+    Returns:
+        True if the decorated function can be called, False otherwise
+    """
+    if not AsyncBrowserManager.ready():
+        await AsyncBrowserManager.init()
+        logger.debug('Decorator: Initialized browser manager')
 
-                logger.debug('Decorator: Login successful, calling function')
-                return await func(*args, **kwargs)
+    try:
+        if await AsyncBrowserManager.login_cached():
+            logger.debug('Decorator: Login checked recently, calling wrapped function')
+            return True
 
-        except NotLoggedInError as e:
-            logger.error('Decorator: Login error:', e)
-            return
-        except Exception as e:
-            logger.error('Decorator: Unexpected error:', e)
-            raise
-    return wrapper
+        logger.debug('Decorator: Checking if logged in...')
+        if await AsyncBrowserManager.logged_in():
+            logger.debug('Decorator: Already logged in, calling wrapped function')
+            return True
+        else:
+            logger.debug('Decorator: Not logged in, attempting login...')
+            await login(AsyncBrowserManager.get_page())
+            logger.debug('Decorator: Login attempted')
+
+            if not await AsyncBrowserManager.logged_in():
+                raise NotLoggedInError('Login attempt failed')
+            # The other browser instances started with the logged out session of the profile
+            await AsyncBrowserManager.share_session()
+
+            logger.debug('Decorator: Login successful, calling function')
+            return True
+
+    except NotLoggedInError as e:
+        logger.error('Decorator: Login error:', e)
+        return False
+    except Exception as e:
+        logger.error('Decorator: Unexpected error:', e)
+        raise
 
 
 ####################
@@ -0,0 +1,150 @@
+from main.adb import run_query, values_list
+from main.followers import FollowerRow
+from main.scheduler import get_priority
+from tools.logger import logger
+import socket
+import os
+
+
+# A handle that is already waiting or being extracted keeps its job, a finished one is queued again
+ENQUEUE_QUERY = """
+    INSERT INTO jobs (
+        account_id, handle, priority, age, follower, flagged, newest_post_id, failures
+    ) VALUES {values}
+    ON CONFLICT (account_id, handle) DO UPDATE SET
+        state = 'queued',
+        priority = EXCLUDED.priority,
+        age = EXCLUDED.age,
+        follower = EXCLUDED.follower,
+        flagged = EXCLUDED.flagged,
+        newest_post_id = EXCLUDED.newest_post_id,
+        failures = EXCLUDED.failures,
+        attempts = 0,
+        leased_by = NULL,
+        lease_until = NULL,
+        created_at = NOW(),
+        updated_at = NOW()
+    WHERE jobs.state IN ('done', 'failed')
+"""
+
+# Jobs whose lease expired too many times (ie: their worker keeps crashing on them) are given up
+REAP_QUERY = """
+    UPDATE jobs SET state = 'failed', last_error = 'Lease expired', leased_by = NULL, updated_at = NOW()
+    WHERE account_id = %s AND state = 'claimed' AND lease_until < NOW() AND attempts >= %s
+"""
+
+# Queued jobs and jobs whose worker stopped heartbeating, by priority (aging included)
+# SKIP LOCKED: concurrent workers claim different jobs instead of waiting for each other
+CLAIM_QUERY = """
+    WITH claimable AS (
+        SELECT id FROM jobs
+        WHERE account_id = %(uid)s
+        AND (state = 'queued' OR (state = 'claimed' AND lease_until < NOW()))
+        ORDER BY priority + %(aging)s * EXTRACT(EPOCH FROM NOW() - created_at) DESC, id
+        LIMIT %(batch_size)s
+        FOR UPDATE SKIP LOCKED
+    )
+    UPDATE jobs j SET
+        state = 'claimed',
+        leased_by = %(worker_id)s,
+        lease_until = NOW() + make_interval(secs => %(lease)s),
+        attempts = j.attempts + 1,
+        updated_at = NOW()
+    FROM claimable
+    WHERE j.id = claimable.id
+    RETURNING j.handle, j.age, j.follower, j.flagged, j.newest_post_id, j.failures
+"""
+
+HEARTBEAT_QUERY = """
+    UPDATE jobs SET lease_until = NOW() + make_interval(secs => %s), updated_at = NOW()
+    WHERE account_id = %s AND handle = ANY(%s) AND leased_by = %s AND state = 'claimed'
+"""
+
+COMPLETE_QUERY = """
+    UPDATE jobs SET state = 'done', leased_by = NULL, lease_until = NULL, updated_at = NOW()
+    WHERE account_id = %s AND handle = ANY(%s) AND leased_by = %s
+"""
+
+# Failed jobs go back to the queue until they run out of attempts
+RELEASE_QUERY = """
+    UPDATE jobs SET
+        state = CASE WHEN attempts >= %s THEN 'failed' ELSE 'queued' END,
+        last_error = 'Extraction failed',
+        leased_by = NULL,
+        lease_until = NULL,
+        updated_at = NOW()
+    WHERE account_id = %s AND handle = ANY(%s) AND leased_by = %s
+"""
+
+
+def get_worker_id():
+    return f'{socket.gethostname()}-{os.getpid()}'
+
+
+async def enqueue_jobs(uid, rows, weights):
+    """Queue the given FollowerRow as jobs, in one query
+    Args:
+        weights: Points of each priority signal (scheduler.weights)
+    Returns:
+        False if the query failed
+    """
+    if not rows:
+        return True
+    placeholders, params = values_list([(uid, row.handle, get_priority(row, weights), *row[1:]) for row in rows])
+    if not await run_query(ENQUEUE_QUERY.format(values=placeholders), params):
+        logger.error(f'Unable to queue {len(rows)} jobs')
+        return False
+    return True
+
+
+class JobLease:
+    """The jobs claimed by a worker: claims by batches, keeps their lease alive and reports how they ended
+    Used as the frontier of the pipeline (mark()), outcomes are written once per batch
+    """
+
+    def __init__(self, uid, jobs_settings, worker_id=None):
+        self.uid = uid
+        self.worker_id = worker_id or get_worker_id()
+        self.batch_size = jobs_settings['batch_size']
+        self.lease = jobs_settings['lease']
+        self.max_attempts = jobs_settings['max_attempts']
+        self.aging = jobs_settings['aging']
+        self.held = set()
+        self.done = set()
+        self.failed = set()
+
+    async def claim(self):
+        """
+        Returns:
+            The FollowerRow of the claimed jobs, empty when there is nothing left to do
+        """
+        await run_query(REAP_QUERY, (self.uid, self.max_attempts))
+        rows = await run_query(CLAIM_QUERY, {
+            'uid': self.uid, 'aging': self.aging, 'batch_size': self.batch_size,
+            'worker_id': self.worker_id, 'lease': self.lease
+        }, fetch=True)
+        rows = [FollowerRow(*row) for row in rows or []]
+        self.held.update(row.handle for row in rows)
+        return rows
+
+    async def heartbeat(self):
+        if self.held:
+            await run_query(HEARTBEAT_QUERY, (self.lease, self.uid, list(self.held), self.worker_id))
+
+    def mark(self, handle, state):
+        if handle not in self.held:
+            return
+        if state == 'done':
+            self.done.add(handle)
+        elif state == 'failed':
+            self.failed.add(handle)
+
+    async def flush(self):
+        """Report the outcome of the jobs of the batch, handles without any outcome are retried"""
+        self.failed |= self.held - self.done - self.failed
+        if self.done:
+            await run_query(COMPLETE_QUERY, (self.uid, list(self.done), self.worker_id))
+        if self.failed:
+            await run_query(RELEASE_QUERY, (self.max_attempts, self.uid, list(self.failed), self.worker_id))
+        logger.info(f'Job batch over: {len(self.done)} done, {len(self.failed)} failed')
+        self.held, self.done, self.failed = set(), set(), set()
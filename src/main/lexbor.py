@@ -0,0 +1,137 @@
+from selectolax.lexbor import LexborHTMLParser
+import re
+
+
+# Same lookups as the HTML transform of main/transform.py (and js/extract_profile.js), on a lexbor tree:
+# the raw profile fields come out in the shape of the evaluate mode, for transform_user_json() to finish the job
+
+DATE_PATTERN = re.compile(r'\d{4}')
+NUMBER_PATTERN = re.compile(r'\d( (M|k))?')
+URL_PATTERN = re.compile(r'\w+\.\w+(\/\w+)?')
+
+
+###################
+# Helper functions
+
+def select(node, selector):
+    """Descendants of node matching selector: unlike BeautifulSoup, lexbor also matches the node itself"""
+    return [match for match in node.css(selector) if match != node]
+
+
+def select_first(node, selector):
+    return next((match for match in node.css(selector) if match != node), None)
+
+
+def has_text(node):
+    return node.text().strip() != ''
+
+
+def tag_string(node):
+    """Equivalent of BeautifulSoup's Tag.string: only defined for a single child chain ending with a text node"""
+    children = list(node.iter(include_text=True))
+    if len(children) != 1:
+        return None
+    child = children[0]
+    if child.is_text_node:
+        return child.text_content
+    return tag_string(child) if child.is_element_node else None
+
+
+def leaf_span(wrapper):
+    """First span with some text and no nested span"""
+    return next((span for span in select(wrapper, 'span') if has_text(span) and not select_first(span, 'span')), None)
+
+
+def find_span(wrapper, pattern):
+    """Equivalent of wrapper.find('span', string=pattern)"""
+    if wrapper is None:
+        return None
+    return next((span for span in select(wrapper, 'span') if pattern.search(tag_string(span) or '')), None)
+
+
+def find_string(wrapper, pattern):
+    """Equivalent of wrapper.find(string=pattern): the first text node matching pattern"""
+    return next((
+        node.text_content for node in wrapper.traverse(include_text=True)
+        if node.is_text_node and pattern.search(node.text_content)
+    ), None)
+
+
+def get_stat(container):
+    """Equivalent of tools.utils.get_stats() for one interaction counter"""
+    counter = select_first(container, 'span span')
+    value = select_first(counter, 'span') if counter else None
+    return value.text() if value else '0'
+
+
+####################
+# Fields extraction
+
+def get_post_fields(article):
+    """
+    Returns:
+        The raw fields of a post, as get_post_from_json() takes them
+    """
+    # Two children: username wrapper, then handle/datetime wrapper
+    posted_by_at_grp = select_first(article, 'div[data-testid="User-Name"]')
+    pbag_children = [child for child in posted_by_at_grp.iter() if child.tag == 'div']
+    userhandle_dt_wrapper = pbag_children[1]
+
+    status_links = [
+        a for a in select(userhandle_dt_wrapper, 'a')
+        if 'status/' in (a.attributes.get('href') or '') and not select_first(a, 'a')
+    ]
+    username_elem = leaf_span(pbag_children[0])
+    tweet_text_elem = select_first(article, 'div[data-testid="tweetText"]')
+    tweet_text_span = select_first(tweet_text_elem, 'span') if tweet_text_elem else None
+    stats_grp = select(article, 'span[data-testid="app-text-transition-container"]')
+
+    return {
+        'id': status_links[-1].attributes['href'].split('/')[-1],
+        'handle': leaf_span(userhandle_dt_wrapper).text()[1:],
+        'username': username_elem.text() if username_elem else None,
+        'timestamp': select_first(userhandle_dt_wrapper, 'time').attributes['datetime'],
+        'stats': [get_stat(container) for container in stats_grp],
+        'text': tweet_text_span.text() if tweet_text_span else None,
+        'repost': select_first(article, 'span[data-testid="socialContext"]') is not None
+    }
+
+
+def get_profile_fields(html, handle):
+    """Parse a profile page with lexbor
+    Returns:
+        The raw profile fields and posts, as transform_user_json() takes them
+    """
+    tree = LexborHTMLParser(html)
+
+    user_name_wrapper = tree.css_first('div[data-testid="UserName"]')
+    user_name_elem = next(
+        (div for div in select(user_name_wrapper, 'div') if has_text(div) and not select_first(div, 'div')), None
+    )
+
+    bio_wrapper = tree.css_first('[data-testid="UserDescription"]')
+    bio_elem = next((span for span in select(bio_wrapper, 'span') if has_text(span)), None) if bio_wrapper else None
+
+    joined_elem = find_span(tree.css_first('[data-testid="UserJoinDate"]'), DATE_PATTERN)
+    following_elem = find_span(tree.css_first(f'a[href="/{handle}/following"]'), NUMBER_PATTERN)
+    followers_elem = find_span(tree.css_first(f'a[href="/{handle}/verified_followers"]'), NUMBER_PATTERN)
+
+    # profile_header: only available on profiles that include a location and/or a website
+    url = None
+    profile_header = tree.css_first('[data-testid="UserProfileHeader_Items"]')
+    user_url = select_first(profile_header, '[data-testid="UserUrl"]') if profile_header else None
+    if user_url:
+        url = find_string(user_url, URL_PATTERN)
+
+    feed_region = tree.css_first('section[role="region"]')
+
+    return {
+        'username': user_name_elem.text(),
+        'certified': select_first(user_name_wrapper, 'svg[data-testid="icon-verified"]') is not None,
+        'bio': bio_elem.text() if bio_elem else None,
+        'joined': joined_elem.text(),
+        'following_str': following_elem.text(),
+        'followers_str': followers_elem.text(),
+        'url': url,
+        'articles': [get_post_fields(article) for article in select(feed_region, 'article[data-testid="tweet"]')]
+    }
@@ -0,0 +1,355 @@
+from main.extract import get_follower_cells, get_user_data, limiter
+from main.transform import transform_user_data_async
+from main.freshness import FreshnessPolicy
+from main.followers import follower_diff
+from main.triage import Triage
+from main.scheduler import Scheduler, record_failure, clear_failures
+from main.frontier import Frontier
+from main.jobs import JobLease, enqueue_jobs
+from classes.entities import XUser
+from tools.logger import logger
+from dataclasses import replace
+from config import settings
+import traceback
+import asyncio
+
+
+###################
+# Helper functions
+
+def start_workers(count, worker, *args):
+    """Start a pool of identical workers for a pipeline stage
+    Args:
+        count: Number of concurrent workers for this stage
+        worker: The coroutine function run by each worker
+    Returns:
+        The list of started worker tasks
+    """
+    return [asyncio.create_task(worker(*args)) for _ in range(max(1, count))]
+
+
+async def select_handles(cells, diff, freshness, triage):
+    """Pick the followers of a harvested chunk that need a profile page load
+    Args:
+        cells: The FollowerCell of each handle of the chunk
+    Returns:
+        The FollowerRow of each handle to extract
+    """
+    rows = await diff.add([cell.handle for cell in cells])
+    return await triage.select_deep(cells, rows, freshness.select_stale(rows))
+
+
+async def enqueue_handles(scheduler, rows, stats):
+    for row in rows:
+        await scheduler.put(row)
+        stats['queued'] += 1
+
+
+async def stop_workers(workers):
+    for worker in workers:
+        worker.cancel()
+    await asyncio.gather(*workers, return_exceptions=True)
+
+
+##################
+# Pipeline stages
+
+async def extract_worker(scheduler, extract_queue, uid, frontier, stats, stopping=None):
+    while True:
+        # Only pick the next handle once allowed to extract it: the scheduler gets to choose the most
+        # urgent handle at the time a page is actually loaded, not when a worker starts waiting
+        async with limiter:
+            row = await scheduler.get(stopping)
+            if row is None: # Draining: the handles left stay pending in the frontier
+                return
+            frontier.mark(row.handle, 'in_flight')
+            try:
+                user_extract = await get_user_data(row.handle, row.newest_post_id)
+            except Exception:
+                logger.critical(f'Exception while extracting {row.handle}:\n{traceback.format_exc()}')
+                user_extract = None
+
+        try:
+            if not user_extract or not (user_extract.html or user_extract.data or user_extract.graphql):
+                frontier.mark(row.handle, 'failed')
+                await record_failure(uid, row.handle)
+            else:
+                if row.failures:
+                    await clear_failures(uid, row.handle)
+                # Lets the transform stop at the posts already in DB
+                user_extract = replace(user_extract, newest_post_id=row.newest_post_id)
+                # Blocks while the transform stage is late: caps how much HTML is held in memory
+                await extract_queue.put(user_extract)
+                stats['extracted'] += 1
+        finally:
+            scheduler.task_done()
+
+
+async def transform_worker(extract_queue, load_queue, uid, frontier, stats):
+    while True:
+        user_extract = await extract_queue.get()
+        try:
+            # Transform this data into relevant data types, get each follower/user's first posts
+            try:
+                xuser = await transform_user_data_async(user_extract, uid)
+            except Exception:
+                logger.critical(f'Exception while transforming {user_extract.handle}:\n{traceback.format_exc()}')
+                xuser = None
+            # Users without any new post are loaded too: their profile fields and last_updated get refreshed
+            if xuser:
+                await load_queue.put(xuser)
+                stats['transformed'] += 1
+            else:
+                frontier.mark(user_extract.handle, 'failed')
+        finally:
+            extract_queue.task_done()
+
+
+async def upsert_batch(batch):
+    """Insert a batch of users AND their associated posts, in one transaction
+    With the sync driver psycopg2 is blocking: it runs in a thread so that browser pages keep going meanwhile
+    """
+    if settings['db']['driver'] == 'async':
+        return await XUser.aupsert_many(batch)
+    return await asyncio.to_thread(XUser.upsert_many, batch)
+
+
+async def load_worker(load_queue, frontier, stats):
+    loop = asyncio.get_running_loop()
+    batch_size = settings['load']['batch_size']
+    flush_interval = settings['load']['flush_interval']
+
+    while True:
+        # Gather users until the batch is full or the oldest one waited for flush_interval seconds
+        batch = [await load_queue.get()]
+        deadline = loop.time() + flush_interval
+        while len(batch) < batch_size:
+            try:
+                batch.append(await asyncio.wait_for(load_queue.get(), deadline - loop.time()))
+            except asyncio.TimeoutError:
+                break
+
+        loaded = False
+        try:
+            loaded = bool(await upsert_batch(batch))
+            if loaded:
+                stats['loaded'] += len(batch)
+        except Exception as e:
+            logger.error(f'Unable to load a batch of {len(batch)} users: {e}')
+        finally:
+            # A handle is only done once in DB: after a crash, it gets extracted again on resume
+            for xuser in batch:
+                frontier.mark(xuser.handle, 'done' if loaded else 'failed')
+            for _ in batch:
+                load_queue.task_done()
+
+
+#####################
+# Pipeline execution
+
+async def harvest(uid, enqueue, stats, stopping=None):
+    """Scroll the followers list and queue the followers to extract
+    Args:
+        enqueue: Coroutine function queuing a list of FollowerRow for extraction
+        stopping: asyncio.Event set when the process is asked to stop: the scrolling stops at the next follower
+    Returns:
+        False if the scrolling was stopped before the end of the list
+    """
+    followers_settings = settings['followers']
+    freshness = FreshnessPolicy(settings['freshness'])
+    triage = Triage(uid, settings['triage'])
+
+    async with follower_diff(uid, followers_settings['max_departed_ratio']) as diff:
+        # Follower handles are fed to the extract stage while the followers list is being scrolled, by chunks:
+        # one query per chunk tells the new followers apart and filters out the recently refreshed ones,
+        # then the followers list cells tell which of the others are worth a profile page load
+        chunk = []
+        interrupted = False
+        async for cell in get_follower_cells():
+            if stopping and stopping.is_set():
+                interrupted = True
+                break
+            chunk.append(cell)
+            stats['harvested'] += 1
+            if len(chunk) >= followers_settings['chunk_size']:
+                await enqueue(await select_handles(chunk, diff, freshness, triage))
+                chunk = []
+        await enqueue(await select_handles(chunk, diff, freshness, triage))
+
+        # Who is missing can only be told once the whole list was scrolled
+        if not interrupted and (not followers_settings['max_handles'] or stats['harvested'] < followers_settings['max_handles']):
+            await diff.mark_departed()
+        diff.log_stats()
+
+    freshness.log_stats()
+    triage.log_stats()
+    return not interrupted
+
+
+def start_stages(scheduler, uid, frontier, stats, stopping=None):
+    """Start the workers of the extract, transform and load stages, fed by the scheduler
+    Args:
+        frontier: Tracks how each handle ended (see Frontier.mark())
+        stopping: asyncio.Event set to stop the extract workers from taking new handles
+    Returns:
+        The started workers, then the queues to join once the scheduler was fed: in order
+    """
+    pipeline_settings = settings['pipeline']
+    extract_queue = asyncio.Queue(maxsize=pipeline_settings['queue_size'])
+    load_queue = asyncio.Queue(maxsize=pipeline_settings['queue_size'])
+
+    workers = [
+        *start_workers(pipeline_settings['extract_workers'], extract_worker, scheduler, extract_queue, uid, frontier, stats, stopping),
+        *start_workers(pipeline_settings['transform_workers'], transform_worker, extract_queue, load_queue, uid, frontier, stats),
+        *start_workers(pipeline_settings['load_workers'], load_worker, load_queue, frontier, stats)
+    ]
+    # Each stage feeds the next one before marking its item as done: join them in order
+    return workers, (scheduler, extract_queue, load_queue)
+
+
+async def join_stages(workers, queues, stopping=None):
+    """Wait for every handle of the scheduler to go through the stages
+    Once stopping is set, only the handles already taken by the extract workers are waited for
+    Returns:
+        False if handles were left in the scheduler
+    """
+    scheduler, *downstream = queues
+    joiner = asyncio.create_task(scheduler.join())
+    waiters = {joiner, asyncio.create_task(stopping.wait())} if stopping else {joiner}
+    await asyncio.wait(waiters, return_when=asyncio.FIRST_COMPLETED)
+    for waiter in waiters:
+        waiter.cancel()
+    drained = joiner.done() and not joiner.cancelled()
+
+    if not drained:
+        # Extract workers (started first) return once their in-flight handle was passed on to the transform stage
+        await asyncio.gather(*workers[:settings['pipeline']['extract_workers']], return_exceptions=True)
+    for queue in downstream:
+        await queue.join()
+    return drained
+
+
+def log_stats(stats):
+    logger.info(
+        f'Pipeline done: {stats["harvested"]} harvested, {stats["resumed"]} resumed, {stats["queued"]} queued, '
+        f'{stats["extracted"]} extracted, {stats["transformed"]} transformed, {stats["loaded"]} loaded'
+    )
+
+
+async def run_pipeline(uid, resume=False, stopping=None):
+    """Run extract, transform and load as overlapping stages connected by bounded queues
+    Each stage has its own worker count, a full queue makes the previous stage wait (backpressure)
+    Args:
+        uid: The account ID the followers are attached to
+        resume: Continue the last unfinished run from its checkpoint instead of starting over
+        stopping: asyncio.Event set to drain the run: no more handles are harvested or extracted, the in-flight
+            ones are still processed and the run stays resumable
+    Returns:
+        A dict counting the handles processed by each stage
+    """
+    stats = {'harvested': 0, 'resumed': 0, 'queued': 0, 'extracted': 0, 'transformed': 0, 'loaded': 0}
+
+    # Unlike the other queues, handles are cheap to hold: the more of them the scheduler sees, the better it picks
+    scheduler = Scheduler(settings['scheduler'])
+
+    # Pending and in-flight handles of the resumed run go first, the followers list is only scrolled
+    # again if the crash happened before its end
+    frontier = Frontier(uid, settings['checkpoint'])
+    resumed_rows, harvested = await frontier.open(resume)
+    stats['resumed'] = len(resumed_rows)
+    await enqueue_handles(scheduler, resumed_rows, stats)
+
+    async def enqueue(rows):
+        # The handles a resumed run already had are not queued twice
+        await enqueue_handles(scheduler, frontier.add(rows), stats)
+
+    workers, queues = start_stages(scheduler, uid, frontier, stats, stopping)
+    finished = False
+    try:
+        if not harvested:
+            harvested = await harvest(uid, enqueue, stats, stopping)
+            # A resumed run won't scroll the list again
+            if harvested and stats['harvested']:
+                await frontier.set_harvested()
+
+        # A drained run stays resumable: the handles left in the scheduler are still pending in the frontier
+        finished = await join_stages(workers, queues, stopping) and harvested
+    finally:
+        await stop_workers(workers)
+        # Whatever happened, write the progress made so far
+        await frontier.close(finished)
+
+    log_stats(stats)
+    return stats
+
+
+##################
+# Distributed mode
+
+async def run_coordinator(uid, stopping=None):
+    """Harvest the followers list and queue the followers to extract as jobs, for workers to claim
+    Args:
+        stopping: asyncio.Event set to stop harvesting, the jobs queued so far stay queued
+    Returns:
+        A dict counting the harvested and queued handles
+    """
+    stats = {'harvested': 0, 'resumed': 0, 'queued': 0, 'extracted': 0, 'transformed': 0, 'loaded': 0}
+
+    async def enqueue(rows):
+        if await enqueue_jobs(uid, rows, settings['scheduler']['weights']):
+            stats['queued'] += len(rows)
+
+    await harvest(uid, enqueue, stats, stopping)
+    logger.info(f'Coordinator done: {stats["harvested"]} harvested, {stats["queued"]} jobs queued')
+    return stats
+
+
+async def heartbeat(lease, interval):
+    while True:
+        await asyncio.sleep(interval)
+        await lease.heartbeat()
+
+
+async def run_worker(uid, stopping=None):
+    """Claim batches of jobs and run extract, transform and load on them, until no job is left
+    (or forever if jobs.idle_exit is 0). Any number of workers can run side by side, each with its own browser
+    Args:
+        stopping: asyncio.Event set to stop claiming jobs, the current batch is still processed
+    Returns:
+        A dict counting the handles processed by each stage
+    """
+    jobs_settings = settings['jobs']
+    stats = {'harvested': 0, 'resumed': 0, 'queued': 0, 'extracted': 0, 'transformed': 0, 'loaded': 0}
+    loop = asyncio.get_running_loop()
+
+    scheduler = Scheduler(settings['scheduler'])
+    lease = JobLease(uid, jobs_settings)
+    logger.info(f'Worker {lease.worker_id} started')
+
+    workers, queues = start_stages(scheduler, uid, lease, stats)
+    # Claimed jobs stay ours as long as we're alive, a crashed worker's jobs get claimed again once their lease expires
+    heartbeat_task = asyncio.create_task(heartbeat(lease, jobs_settings['heartbeat']))
+    idle_since = loop.time()
+    try:
+        while not (stopping and stopping.is_set()):
+            rows = await lease.claim()
+            if not rows:
+                if jobs_settings['idle_exit'] and loop.time() - idle_since >= jobs_settings['idle_exit']:
+                    break
+                await asyncio.sleep(jobs_settings['poll_interval'])
+                continue
+
+            await enqueue_handles(scheduler, rows, stats)
+            for queue in queues:
+                await queue.join()
+            await lease.flush()
+            idle_since = loop.time()
+    finally:
+        heartbeat_task.cancel()
+        await stop_workers([heartbeat_task, *workers])
+        # Jobs of an interrupted batch are given back right away instead of waiting for their lease to expire
+        if lease.held:
+            await lease.flush()
+
+    log_stats(stats)
+    return stats
@@ -0,0 +1,103 @@
+from main.adb import run_query
+from tools.logger import logger
+import itertools
+import asyncio
+
+
+RECORD_FAILURE_QUERY = """
+    INSERT INTO extract_failures (account_id, handle, failures, last_failure)
+    VALUES (%s, %s, 1, NOW())
+    ON CONFLICT (account_id, handle) DO UPDATE SET
+        failures = extract_failures.failures + 1,
+        last_failure = NOW()
+"""
+
+CLEAR_FAILURES_QUERY = 'DELETE FROM extract_failures WHERE account_id = %s AND handle = %s'
+
+
+def get_priority(row, weights):
+    """Priority points of a FollowerRow, the higher the sooner
+    Args:
+        weights: Points of each signal (scheduler.weights)
+    """
+    priority = 0
+    if not row.follower:
+        priority += weights['new']
+    if row.flagged:
+        priority += weights['flagged']
+
+    # Never stored handles count as the stalest ones
+    stale_days = row.age / 86400 if row.age is not None else weights['max_stale_days']
+    priority += weights['stale_per_day'] * min(stale_days, weights['max_stale_days'])
+
+    # Handles that keep failing go after the others, until aging catches up
+    priority -= weights['failure'] * row.failures
+    return priority
+
+
+class Scheduler:
+    """Priority queue in front of the extract stage: the most important followers are extracted first,
+    so that a run cut short has visited them. Signals are weighted in settings.json (scheduler.weights):
+    new follower, staleness, classification and previous failures
+    Aging: waiting handles gain scheduler.aging priority points per second, low-priority ones are never starved
+    """
+
+    def __init__(self, scheduler_settings):
+        self.weights = scheduler_settings['weights']
+        self.aging = scheduler_settings['aging']
+        self.queue = asyncio.PriorityQueue(scheduler_settings['max_pending'])
+        self.order = itertools.count() # Ties are served in harvest order
+        self.start = None
+
+    def get_priority(self, row):
+        return get_priority(row, self.weights)
+
+    def get_key(self, row, now):
+        """Heap key of a row queued at loop time now, the lowest keys are served first"""
+        if self.start is None:
+            self.start = now
+
+        # Ordering by priority + aging * waited time is the same as ordering by aging * enqueue time - priority,
+        # which doesn't change while waiting: it can be used as a static heap key
+        return self.aging * (now - self.start) - self.get_priority(row), next(self.order)
+
+    async def put(self, row):
+        await self.queue.put((*self.get_key(row, asyncio.get_running_loop().time()), row))
+
+    async def get(self, stopping=None):
+        """
+        Args:
+            stopping: asyncio.Event set to stop serving rows
+        Returns:
+            The next row, None once stopping is set
+        """
+        if stopping is None:
+            _, _, row = await self.queue.get()
+            return row
+        if stopping.is_set():
+            return None
+
+        getter = asyncio.create_task(self.queue.get())
+        stopper = asyncio.create_task(stopping.wait())
+        await asyncio.wait({getter, stopper}, return_when=asyncio.FIRST_COMPLETED)
+        stopper.cancel()
+        if not getter.done():
+            getter.cancel()
+            return None
+        _, _, row = getter.result()
+        return row
+
+    def task_done(self):
+        self.queue.task_done()
+
+    async def join(self):
+        await self.queue.join()
+
+
+async def record_failure(uid, handle):
+    if not await run_query(RECORD_FAILURE_QUERY, (uid, handle)):
+        logger.error(f'Unable to record the extraction failure of {handle}')
+
+
+async def clear_failures(uid, handle):
+    await run_query(CLEAR_FAILURES_QUERY, (uid, handle))
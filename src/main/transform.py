@@ -1,12 +1,23 @@
+from main.graphql import get_user_fields, get_timeline_tweets, get_post_fields, to_display_count
+from main.graphql import USER_OPERATION, TIMELINE_OPERATION
+from main.lexbor import get_profile_fields
 from classes.entities import UserExtract, XUser, XPost
-from tools.utils import str_to_int, get_stats
+from tools.utils import str_to_int, get_stats, make_soup
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from tools.logger import logger
-from bs4 import BeautifulSoup
+from dataclasses import replace
 from dateutil import parser
+from config import settings
+import multiprocessing
+import asyncio
+import logging
 import re
 
 
-# @apply_concurrency_limit(semaphore)
+_executor = None # Process pool shared by every transform call, created on first use
+
+
 def get_post_instance(post_elem, user_handle):
     """Get all data from a given a post
     Args:
@@ -68,10 +79,50 @@ def get_post_instance(post_elem, user_handle):
 
     # stats_grp is a web element group composing the social interaction statistics
     stats_grp = post_elem.select('span[data-testid="app-text-transition-container"]')
-    replies = get_stats(stats_grp, 0)
-    reposts = get_stats(stats_grp, 1)
-    likes = get_stats(stats_grp, 2)
-    views = get_stats(stats_grp, 3) if len(stats_grp) > 3 else str(0)
+    stats = [get_stats(stats_grp, pos) for pos in range(len(stats_grp))]
+
+    tweet_text_elem = post_elem.find('div', {'data-testid': 'tweetText'})
+    tweet_text = tweet_text_elem.select('span') if tweet_text_elem else None
+    cleaned_text = tweet_text[0].text if tweet_text else None
+
+    ###############################
+    # Step 3: Return post instance
+
+    return make_xpost(post_id, timestamp, username, handle, cleaned_text, stats, reposted)
+
+
+def get_post_from_json(post_data, user_handle):
+    """Same as get_post_instance() but from the fields extracted in the browser (see js/extract_profile.js)
+    Args:
+        post_data: Dict holding the raw fields of a post
+        user_handle: The current user's handle
+    Returns:
+        A XPost instance or None if the post is not a repost or from current user
+    """
+    handle = post_data['handle']
+    post_id = post_data['id']
+    reposted = post_data['repost']
+
+    if not reposted:
+        if not handle == user_handle:
+            logger.debug(f'{post_id} - Discarded')
+            return
+
+    username = handle[1:] if not post_data['username'] else post_data['username']
+    timestamp = post_data['timestamp'][:-5]
+
+    return make_xpost(post_id, timestamp, username, handle, post_data['text'], post_data['stats'], reposted)
+
+
+def make_xpost(post_id, timestamp, username, handle, cleaned_text, stats, reposted):
+    """Build a XPost out of the raw post fields, whatever the extraction mode they come from
+    Args:
+        stats: The displayed interaction counters: replies, reposts, likes and views (optional)
+    """
+    replies = stats[0]
+    reposts = stats[1]
+    likes = stats[2]
+    views = stats[3] if len(stats) > 3 else str(0)
 
     # Prepare stats for the upcoming DB storage
     replies = str_to_int(replies)
@@ -79,21 +130,82 @@ def get_post_instance(post_elem, user_handle):
     likes = str_to_int(likes)
     views = str_to_int(views)
 
-    tweet_text_elem = post_elem.find('div', {'data-testid': 'tweetText'})
-    tweet_text = tweet_text_elem.select('span') if tweet_text_elem else None
-    cleaned_text = tweet_text[0].text if tweet_text else None
-
     logger.debug(f'{post_id} - Timestamp: {timestamp} - Text: {"True" if cleaned_text else "False"} - Reposted: {reposted} - Handle: {handle}')
 
-    ###############################
-    # Step 3: Return post instance
-
     return XPost(
         post_id, timestamp, username, handle, cleaned_text,
         replies, reposts, likes, views, reposted
     )
 
 
+def make_xuser(uid, handle, username, certified, bio, joined_str, following_str, followers_str, url, follower):
+    """Build a XUser out of the raw profile fields, whatever the extraction mode they come from
+    Args:
+        joined_str: Text of the join date element (ie: 'Joined March 2015')
+        following_str / followers_str: The counts as displayed on the profile
+    """
+    date_str_list = joined_str.strip().split(' ')[-2:]
+    date_str = ' '.join(date_str_list)
+
+    # Use datutil parser instead of datetime.strptime, works for any locale
+    # Force set the day as we don't get the actual day when users create their account
+    date_joined = parser.parse(date_str).replace(day=1)
+
+    following_int = str_to_int(following_str)
+    followers_int = str_to_int(followers_str)
+
+    xuser = XUser(
+        uid,
+        handle,
+        username, certified,
+        bio, date_joined,
+        following_int,
+        followers_int,
+        following_str,
+        followers_str,
+        url,
+        follower
+    )
+
+    logger.info(f'User: handle: {handle} - Joined: {date_joined} - Certified: {certified} - Followers: {followers_int} - Following: {following_int}')
+
+    return xuser
+
+
+def add_posts(xuser, articles, get_post, newest_post_id=None):
+    """Add the valid posts to the user, newest first, skipping the posts already in DB
+    The walk stops after timeline.stop_streak known posts in a row: a single known post doesn't tell
+    the rest is old, as a reply thread shows its older parent post above the new reply
+    Args:
+        articles: The posts found on the profile, in any format get_post() accepts
+        get_post: Function returning a XPost (or None) out of a post and the user handle
+        newest_post_id: ID of the newest post of the user already in DB, if any
+    """
+    if articles:
+        logger.info(f'Posts processing: {len(articles)} posts found')
+        stop_streak = settings['timeline']['stop_streak']
+        accepted = 0
+        known = 0 # Known posts in a row
+        for i, article in enumerate(articles):
+            xpost = get_post(article, xuser.handle)
+            if not xpost:
+                continue
+
+            # The first valid post can be a pinned one, older than the next ones: never skip it
+            # Reposts are ordered by repost date but carry the ID of the original post: never skip them either
+            if newest_post_id and accepted and not xpost.repost and int(xpost.id) <= newest_post_id:
+                known += 1
+                if known >= stop_streak:
+                    logger.info(f'Reached {known} known posts in a row: skipped the {len(articles) - i - 1} older posts')
+                    break
+                continue
+
+            known = 0
+            xuser.add_article(xpost)
+            accepted += 1
+        logger.info(f'Found {len(xuser.articles)} valid posts out of {len(articles)}')
+
+
 def transform_user_data(user_extract: UserExtract, uid, follower=True):
     """Get all data for a given user
     Args:
@@ -103,8 +215,17 @@ def transform_user_data(user_extract: UserExtract, uid, follower=True):
     Returns:
         A XUser instance to pass to the next layer
     """
+    if user_extract.graphql is not None:
+        return transform_user_graphql(user_extract, uid, follower)
+
+    if user_extract.data is not None:
+        return transform_user_json(user_extract, uid, follower)
+
+    if settings['transform']['parser'] == 'lexbor':
+        return transform_user_lexbor(user_extract, uid, follower)
+
     try:
-        soup = BeautifulSoup(user_extract.html, 'html.parser')
+        soup = make_soup(user_extract.html)
 
         user_name_wrapper = soup.find('div', attrs={'data-testid': 'UserName'})
         user_name_elem = next(
@@ -125,22 +246,14 @@ def transform_user_data(user_extract: UserExtract, uid, follower=True):
 
         date_pattern = re.compile(r'\d{4}')
         joined_elem = soup.find(attrs={'data-testid': 'UserJoinDate'}).find('span', string=date_pattern)
-        date_str_list = joined_elem.text.strip().split(' ')[-2:]
-        date_str = ' '.join(date_str_list)
-
-        # Use datutil parser instead of datetime.strptime, works for any locale
-        # Force set the day as we don't get the actual day when users create their account
-        date_joined = parser.parse(date_str).replace(day=1)
 
         number_pattern = re.compile(r'\d( (M|k))?')
 
         following_elem = soup.find('a', attrs={'href': f'/{user_extract.handle}/following'}).find('span', string=number_pattern)
         following_str = following_elem.text
-        following_int = str_to_int(following_str)
 
         followers_elem = soup.find('a', attrs={'href': f'/{user_extract.handle}/verified_followers'}).find('span', string=number_pattern)
         followers_str = followers_elem.text
-        followers_int = str_to_int(followers_str)
 
         # profile_header: only available on profiles that include a location and/or a website
         profile_header = soup.find(attrs={'data-testid': 'UserProfileHeader_Items'})
@@ -159,32 +272,139 @@ def transform_user_data(user_extract: UserExtract, uid, follower=True):
         # Get user posts
         feed_region = soup.find('section', {'role': 'region'})
 
-        xuser = XUser(
-            uid,
-            user_extract.handle,
-            username, certified,
-            bio, date_joined,
-            following_int,
-            followers_int,
-            following_str,
-            followers_str,
-            redirected_url,
-            follower
+        xuser = make_xuser(
+            uid, user_extract.handle, username, certified, bio, joined_elem.text,
+            following_str, followers_str, redirected_url, follower
+        )
+        add_posts(
+            xuser, feed_region.findAll('article', {'data-testid': 'tweet'}), get_post_instance,
+            user_extract.newest_post_id
+        )
+
+        return xuser
+
+    except (Exception) as e:
+        logger.error(f'Unable to get data: {e}')
+
+
+def transform_user_json(user_extract: UserExtract, uid, follower=True):
+    """Get all data for a given user out of the fields extracted in the browser (evaluate mode)
+    Args:
+        user_extract: class to pass handle/data to this function
+        uid: The account ID that user is attached to
+        follower: Boolean, depends on the caller's location/context
+    Returns:
+        A XUser instance to pass to the next layer
+    """
+    try:
+        data = user_extract.data
+        xuser = make_xuser(
+            uid, user_extract.handle, data['username'].strip(), data['certified'], data['bio'], data['joined'],
+            data['following_str'], data['followers_str'], data['url'], follower
         )
+        add_posts(xuser, data['articles'], get_post_from_json, user_extract.newest_post_id)
+
+        return xuser
+
+    except (Exception) as e:
+        logger.error(f'Unable to get data: {e}')
+
+
+def transform_user_lexbor(user_extract: UserExtract, uid, follower=True):
+    """Same as the HTML transform of transform_user_data(), with the lexbor parser instead of BeautifulSoup
+    Args:
+        user_extract: class to pass handle/html data to this function
+        uid: The account ID that user is attached to
+        follower: Boolean, depends on the caller's location/context
+    Returns:
+        A XUser instance to pass to the next layer
+    """
+    try:
+        data = get_profile_fields(user_extract.html, user_extract.handle)
+    except (Exception) as e:
+        logger.error(f'Unable to get data: {e}')
+        return
 
-        print('-----')
-        logger.info(f'User: handle: {user_extract.handle} - Joined: {date_joined} - Certified: {certified} - Followers: {followers_int} - Following: {following_int}')
+    return transform_user_json(replace(user_extract, data=data), uid, follower)
 
-        articles = feed_region.findAll('article', {'data-testid': 'tweet'})
-        if articles:
-            logger.info(f'Posts processing: {len(articles)} posts found')
-            for article in articles:
-                xpost = get_post_instance(article, user_extract.handle)
-                if xpost:
-                    xuser.add_article(xpost)
-            logger.info(f'Found {len(xuser.articles)} valid posts out of {len(articles)}')
+
+def transform_user_graphql(user_extract: UserExtract, uid, follower=True):
+    """Get all data for a given user out of the GraphQL payloads captured while loading the profile (network mode)
+    Args:
+        user_extract: class to pass handle/payloads to this function
+        uid: The account ID that user is attached to
+        follower: Boolean, depends on the caller's location/context
+    Returns:
+        A XUser instance to pass to the next layer, None if the payloads are unusable
+    """
+    try:
+        user_fields = get_user_fields(user_extract.graphql[USER_OPERATION])
+        if not user_fields:
+            logger.error(f'Unable to get data: no user in the {USER_OPERATION} payload of {user_extract.handle}')
+            return
+
+        # Go through the displayed values so that users get the same created_at (part of the users
+        # unique key) and the same counts as when their profile is transformed in HTML mode
+        xuser = make_xuser(
+            uid, user_extract.handle, user_fields['username'], user_fields['certified'], user_fields['bio'],
+            user_fields['created_at'].strftime('%B %Y'),
+            to_display_count(user_fields['following_count']),
+            to_display_count(user_fields['followers_count']),
+            user_fields['url'], follower
+        )
+        tweets = get_timeline_tweets(user_extract.graphql[TIMELINE_OPERATION])
+        add_posts(xuser, [get_post_fields(tweet) for tweet in tweets], get_post_from_json, user_extract.newest_post_id)
 
         return xuser
 
     except (Exception) as e:
-        logger.error(f'Unable to get data: {e}')
\ No newline at end of file
+        logger.error(f'Unable to get data: {e}')
+
+
+##########################
+# Executor-backed transform
+
+def init_transform_worker(log_level):
+    """Runs once in each pool process: mirror the parent's log level (--debug) in the worker"""
+    logger.setLevel(log_level)
+
+
+def get_transform_executor():
+    global _executor
+    if _executor is None:
+        # Use spawn instead of fork: forking a process that runs Playwright threads is unsafe
+        _executor = ProcessPoolExecutor(
+            max_workers=settings['transform']['workers'],
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=init_transform_worker,
+            initargs=(logging.DEBUG if settings['logs']['debug'] else logging.INFO,)
+        )
+    return _executor
+
+
+def shutdown_transform_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown()
+        _executor = None
+
+
+async def transform_user_data_async(user_extract: UserExtract, uid, follower=True):
+    """Same as transform_user_data() but doesn't block the event loop in process mode
+    Only the UserExtract goes to the worker process, and a picklable XUser (with its XPosts) comes back
+    """
+    if settings['transform']['executor'] == 'process':
+        global _executor
+        loop = asyncio.get_running_loop()
+        executor = get_transform_executor()
+        try:
+            return await loop.run_in_executor(executor, transform_user_data, user_extract, uid, follower)
+        except BrokenProcessPool:
+            # A worker process died (ie: OOM-killed on a large page): the next transforms get a new pool
+            if _executor is executor:
+                logger.error('Transform process pool broken, starting a new one')
+                _executor = None
+                executor.shutdown(wait=False)
+            raise
+
+    return transform_user_data(user_extract, uid, follower)
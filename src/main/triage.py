@@ -0,0 +1,119 @@
+from main.adb import run_query, values_list
+from tools.logger import logger
+import re
+
+
+TRIAGE_UPSERT_QUERY = """
+    INSERT INTO triage (
+        account_id, handle, username, certified, bio, suspect, matched_rules
+    ) VALUES {values}
+    ON CONFLICT (account_id, handle) DO UPDATE SET
+        username = EXCLUDED.username,
+        certified = EXCLUDED.certified,
+        bio = EXCLUDED.bio,
+        suspect = EXCLUDED.suspect,
+        matched_rules = EXCLUDED.matched_rules,
+        last_seen = NOW()
+"""
+
+
+class TriageRule:
+    """A cheap check on one field of a follower cell, configured in settings.json (triage.rules)
+    Matches when the field matches 'pattern' (regex), or when it is empty if 'empty' is set
+    """
+
+    def __init__(self, rule_settings):
+        self.name = rule_settings['name']
+        self.field = rule_settings['field']
+        self.weight = rule_settings.get('weight', 1)
+        self.empty = rule_settings.get('empty', False)
+        pattern = rule_settings.get('pattern')
+        self.pattern = re.compile(pattern) if pattern else None
+
+    def matches(self, cell):
+        value = getattr(cell, self.field)
+        if self.empty:
+            return not value
+        return bool(value and self.pattern and self.pattern.search(str(value)))
+
+
+class Triage:
+    """Light tier of the crawl: scores the followers out of what the followers list shows
+    Followers scoring at least triage.threshold are suspects: they go to the deep crawl even if refreshed recently
+    With triage.spare_retained, retained followers that aren't suspects are never sent to the deep crawl, even when stale
+    """
+
+    def __init__(self, uid, triage_settings):
+        self.uid = uid
+        self.enabled = triage_settings['enabled']
+        self.threshold = triage_settings['threshold']
+        self.spare_retained = triage_settings['spare_retained']
+        self.rules = [TriageRule(rule) for rule in triage_settings['rules']]
+        self.counts = {'triaged': 0, 'suspects': 0, 'forced': 0, 'spared': 0}
+
+    def evaluate(self, cell):
+        """
+        Returns:
+            (suspect, names of the matched rules)
+        """
+        matched = [rule for rule in self.rules if rule.matches(cell)]
+        return sum(rule.weight for rule in matched) >= self.threshold, [rule.name for rule in matched]
+
+    async def store(self, cells, verdicts):
+        rows = [
+            (self.uid, cell.handle, cell.username, cell.certified, cell.bio, *verdicts[cell.handle])
+            for cell in cells
+        ]
+        placeholders, params = values_list(rows)
+        if not await run_query(TRIAGE_UPSERT_QUERY.format(values=placeholders), params):
+            logger.error(f'Unable to store the triage of {len(cells)} followers')
+
+    def select(self, cells, rows, stale):
+        """Triage a chunk of followers and keep the ones worth a profile page load
+        Args:
+            cells: The FollowerCell of each handle of the chunk
+            rows: The FollowerRow of each handle of the chunk
+            stale: The rows the freshness policy didn't skip
+        Returns:
+            (The rows of the followers that are suspects, new or stale, in harvest order
+            (spare_retained: the stale rows of the followers that are new, flagged or suspects),
+            the verdict of each handle)
+        """
+        verdicts = {cell.handle: self.evaluate(cell) for cell in cells}
+        suspects = {handle for handle, (suspect, _) in verdicts.items() if suspect}
+        stale_handles = {row.handle for row in stale}
+
+        if self.spare_retained:
+            # New (or never stored) and flagged followers always go through
+            deep = suspects | {row.handle for row in rows if not row.follower or row.flagged}
+            selected = [row for row in stale if row.handle in deep]
+        else:
+            selected = [
+                row for row in rows
+                if row.handle in suspects or not row.follower or row.handle in stale_handles
+            ]
+
+        self.counts['triaged'] += len(cells)
+        self.counts['suspects'] += len(suspects)
+        self.counts['forced'] += sum(row.handle not in stale_handles for row in selected)
+        self.counts['spared'] += len(stale) - sum(row.handle in stale_handles for row in selected)
+        return selected, verdicts
+
+    async def select_deep(self, cells, rows, stale):
+        """Same as select(), the verdicts are stored along the way
+        Returns:
+            The rows of the followers to extract
+        """
+        if not self.enabled or not cells:
+            return stale
+
+        selected, verdicts = self.select(cells, rows, stale)
+        await self.store(cells, verdicts)
+        return selected
+
+    def log_stats(self):
+        if self.enabled:
+            logger.info(
+                f'Triage: {self.counts["triaged"]} followers, {self.counts["suspects"]} suspects, '
+                f'{self.counts["forced"]} fresh followers queued, {self.counts["spared"]} profile loads spared'
+            )
@@ -4,62 +4,120 @@ All Rights Reserved.
 """
 
 from main.infra import enforce_login, AsyncBrowserManager
-from main.extract import get_user_handles, get_user_data
-from main.transform import transform_user_data
-from main.db import setup_db, register_get_uid
+from main.transform import shutdown_transform_executor
+from main.pipeline import run_pipeline, run_coordinator, run_worker
+from main.db import setup_db, register_get_uid, check_pool, close_pool
+import main.adb as adb
 from config import env, parse_args
 from tools.logger import logger
 from config import settings
 from yaspin import yaspin
 from time import sleep
 import asyncio
+import random
+import signal
+
+
+async def run(uid, mode, resume, stopping):
+    if mode == 'coordinator':
+        return await run_coordinator(uid, stopping)
+    if mode == 'worker':
+        return await run_worker(uid, stopping)
+    return await run_pipeline(uid, resume, stopping)
 
 
 @enforce_login
-async def main(uid):
-    user_handles: list[str] = []
-
-    # Go to the followers page with the browser manager
-    own_account = env.str('USERNAME')
-    followers_url = f'https://x.com/{own_account}/followers'
-    page = AsyncBrowserManager.get_page()
-
-    # Then process the soup to get the user handle of each follower
-    await page.goto(followers_url)
-
-    # EXTRACT:
-    # Extract follower handles
-    user_handles = await get_user_handles()
-
-    if user_handles:
-        async def trigger_extraction():
-            tasks = [get_user_data(handle) for handle in user_handles]
-            return await asyncio.gather(*tasks, return_exceptions=True)
-
-        # Trigger data extraction for each follower
-        if not settings['logs']['debug']:
-            with yaspin(text='Extracting follower data') as spinner:
-                followers_data = await trigger_extraction()
-                spinner.ok('[OK]')
-        else:
-            followers_data = await trigger_extraction()
-
-        # TRANSFORM:
-        # At this point we have follower handles and raw HTML code from each follower profile
-        for user_extract in followers_data:
-            if user_extract.html:
-                # Transform this data into relevant data types, get each follower/user's first posts
-                xuser = transform_user_data(user_extract, uid)
-
-                # LOAD:
-                # Load the discovered followers and their first posts into DB
-                # Triggers user insertion AND the insertion of its associated posts
-                if xuser:
-                    if xuser.articles:
-                        xuser.upsert()
+async def main(uid, mode='pipeline', resume=False, stopping=None):
+    """One crawl: the browser, DB pool and transform executor are left open for the next one
+    Args:
+        mode: 'pipeline' to do everything in this process, or 'coordinator'/'worker' for the distributed mode
+        stopping: asyncio.Event set to drain the crawl (see run_pipeline())
+    """
+    # Workers only get their handles from the jobs table
+    if mode != 'worker':
+        # Go to the followers page with the browser manager
+        own_account = env.str('USERNAME')
+        followers_url = f'https://x.com/{own_account}/followers'
+        page = AsyncBrowserManager.get_page()
+
+        # Then process the soup to get the user handle of each follower
+        await page.goto(followers_url)
+
+    # EXTRACT, TRANSFORM, LOAD:
+    # Stages overlap: profile extraction starts on the first handles while the followers list is
+    # still being scrolled, and the first followers reach the DB while other profiles are loading
+    if not settings['logs']['debug']:
+        with yaspin(text='Extracting follower data') as spinner:
+            stats = await run(uid, mode, resume, stopping)
+            spinner.ok('[OK]')
     else:
-        logger.info('[OK] No new users found')
+        stats = await run(uid, mode, resume, stopping)
 
+    if not stats['queued']:
+        logger.info('[OK] No new or stale users found')
+
+
+async def drain(crawl, stopping, timeout):
+    """Wait for a crawl, once stopping is set it gets timeout seconds to finish its in-flight work
+    Returns:
+        False if the crawl had to be cancelled
+    """
+    stop_task = asyncio.create_task(stopping.wait())
+    await asyncio.wait({crawl, stop_task}, return_when=asyncio.FIRST_COMPLETED)
+    stop_task.cancel()
+
+    if not crawl.done():
+        logger.info(f'Stopping: draining the current crawl (up to {timeout}s)')
+        await asyncio.wait({crawl}, timeout=timeout)
+    if not crawl.done():
+        logger.warning('Drain timeout: cancelling the current crawl, it can be continued with --resume')
+        crawl.cancel()
+
+    try:
+        await crawl
+    except asyncio.CancelledError:
+        return False
+    except Exception as e:
+        # One failed crawl doesn't stop the daemon: the next one resumes it
+        logger.error(f'Crawl failed: {e}')
+    return True
+
+
+async def daemon(uid, mode, resume):
+    """Run crawls every daemon.interval seconds (+/- daemon.jitter) until SIGTERM or SIGINT
+    The browser stays logged in and the DB pool stays open from one crawl to the next
+    """
+    daemon_settings = settings['daemon']
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stopping.set)
+
+    cycle = 0
+    while not stopping.is_set():
+        cycle += 1
+        logger.info(f'Daemon: crawl {cycle} started')
+        # Crawls after the first one continue the previous one if it didn't finish (crash, drain timeout)
+        crawl = asyncio.create_task(main(uid, mode, resume or cycle > 1, stopping))
+        await drain(crawl, stopping, daemon_settings['drain_timeout'])
+        AsyncBrowserManager.log_resource_stats()
+
+        delay = max(0, daemon_settings['interval'] + random.uniform(-daemon_settings['jitter'], daemon_settings['jitter']))
+        if not stopping.is_set():
+            logger.info(f'Daemon: next crawl in {delay:.0f}s')
+        try:
+            await asyncio.wait_for(stopping.wait(), delay)
+        except asyncio.TimeoutError:
+            pass
+    logger.info('Daemon stopped')
+
+
+async def shutdown():
+    shutdown_transform_executor()
+    if settings['db']['driver'] == 'async':
+        await adb.close_pool()
+    else:
+        close_pool()
     await AsyncBrowserManager.close()
 
 
@@ -85,13 +143,30 @@ async def start():
             return
 
 
-    uid = register_get_uid()
+    # The setup above always goes through the sync driver, the pipeline uses the configured one
+    if settings['db']['driver'] == 'async':
+        if not await adb.check_pool():
+            logger.error('Unable to reach the database')
+            return
+        uid = await adb.register_get_uid()
+    else:
+        if not check_pool():
+            logger.error('Unable to reach the database')
+            return
+        uid = register_get_uid()
 
     if not uid:
         logger.error('Unable to get account id')
         return
 
-    await main(uid)
+    mode = 'coordinator' if args.coordinator else 'worker' if args.worker else 'pipeline'
+    try:
+        if args.daemon:
+            await daemon(uid, mode, args.resume)
+        else:
+            await main(uid, mode, args.resume)
+    finally:
+        await shutdown()
 
 
 if __name__ == '__main__':
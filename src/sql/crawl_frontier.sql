@@ -0,0 +1,13 @@
+CREATE TABLE IF NOT EXISTS crawl_frontier (
+    run_id INTEGER REFERENCES crawl_runs(id) ON DELETE CASCADE,
+    handle VARCHAR(255),
+    state VARCHAR(10) CHECK (state IN ('pending', 'in_flight', 'done', 'failed')),
+    -- What the scheduler needs to queue the handle again on resume (see main/followers.py FollowerRow)
+    age DOUBLE PRECISION,
+    follower BOOLEAN,
+    flagged BOOLEAN,
+    newest_post_id BIGINT,
+    failures INTEGER,
+    updated_at TIMESTAMPTZ DEFAULT NOW(),
+    PRIMARY KEY (run_id, handle)
+);
\ No newline at end of file
@@ -0,0 +1,7 @@
+CREATE TABLE IF NOT EXISTS crawl_runs (
+    id SERIAL PRIMARY KEY,
+    account_id INTEGER REFERENCES accounts(id) ON DELETE CASCADE,
+    started_at TIMESTAMPTZ DEFAULT NOW(),
+    harvested_at TIMESTAMPTZ,
+    finished_at TIMESTAMPTZ
+);
\ No newline at end of file
@@ -0,0 +1,7 @@
+CREATE TABLE IF NOT EXISTS extract_failures (
+    account_id INTEGER REFERENCES accounts(id) ON DELETE CASCADE,
+    handle VARCHAR(255),
+    failures INTEGER DEFAULT 0,
+    last_failure TIMESTAMPTZ DEFAULT NOW(),
+    PRIMARY KEY (account_id, handle)
+);
\ No newline at end of file
@@ -0,0 +1,22 @@
+CREATE TABLE IF NOT EXISTS jobs (
+    id SERIAL PRIMARY KEY,
+    account_id INTEGER REFERENCES accounts(id) ON DELETE CASCADE,
+    handle VARCHAR(255),
+    state VARCHAR(10) DEFAULT 'queued' CHECK (state IN ('queued', 'claimed', 'done', 'failed')),
+    priority DOUBLE PRECISION DEFAULT 0,
+    -- What the workers need to extract the handle (see main/followers.py FollowerRow)
+    age DOUBLE PRECISION,
+    follower BOOLEAN,
+    flagged BOOLEAN,
+    newest_post_id BIGINT,
+    failures INTEGER,
+    attempts INTEGER DEFAULT 0,
+    leased_by VARCHAR(255),
+    lease_until TIMESTAMPTZ,
+    last_error TEXT,
+    created_at TIMESTAMPTZ DEFAULT NOW(),
+    updated_at TIMESTAMPTZ DEFAULT NOW(),
+    UNIQUE (account_id, handle)
+);
+
+CREATE INDEX IF NOT EXISTS jobs_claimable_idx ON jobs (account_id, state, lease_until);
\ No newline at end of file
@@ -11,4 +11,7 @@ CREATE TABLE IF NOT EXISTS posts (
     views INTEGER,
     repost BOOLEAN,
     UNIQUE (id, repost)
-);
\ No newline at end of file
+);
+
+-- Newest known post of each user (see main/followers.py)
+CREATE INDEX IF NOT EXISTS posts_user_id_id_idx ON posts (user_id, id);
\ No newline at end of file
@@ -0,0 +1,11 @@
+CREATE TABLE IF NOT EXISTS triage (
+    account_id INTEGER REFERENCES accounts(id) ON DELETE CASCADE,
+    handle VARCHAR(255),
+    username VARCHAR(255),
+    certified BOOLEAN,
+    bio TEXT,
+    suspect BOOLEAN,
+    matched_rules TEXT[],
+    last_seen TIMESTAMPTZ DEFAULT NOW(),
+    PRIMARY KEY (account_id, handle)
+);
\ No newline at end of file
@@ -1,7 +1,13 @@
 from main.db import execute_query, get_connection
+from bs4 import BeautifulSoup
+from config import settings
 import re
 
 
+PARSER_BACKENDS = ('html.parser', 'lxml', 'lexbor')
+SOUP_BACKENDS = ('html.parser', 'lxml') # lexbor has its own tree API, see main/lexbor.py
+
+
 def str_to_int(str):
     multiplier = 1
 
@@ -26,4 +32,18 @@ def str_to_int(str):
 
 def get_stats(stats_grp, stat_pos):
     subset = stats_grp[stat_pos].select('span span')
-    return str(0) if not bool(subset[0].select('span')) else subset[0].select('span')[0].text
\ No newline at end of file
+    return str(0) if not bool(subset[0].select('span')) else subset[0].select('span')[0].text
+
+
+def make_soup(html, backend=None):
+    """Parse HTML with the BeautifulSoup backend set in settings.json (transform.parser)
+    Args:
+        html: The HTML code to parse
+        backend: Overrides the configured backend, one of SOUP_BACKENDS
+    Returns:
+        A BeautifulSoup tree
+    """
+    backend = backend or settings['transform']['parser']
+    if backend not in SOUP_BACKENDS:
+        raise ValueError(f'Unknown parser backend: {backend}')
+    return BeautifulSoup(html, backend)
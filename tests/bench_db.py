@@ -0,0 +1,124 @@
+"""Load stage benchmark: sync (psycopg2) vs async (psycopg 3) database paths
+
+Usage (from the repository root, against the local Postgres configured in settings.json / .env):
+    python tests/bench_db.py [--users N] [--posts N] [--batch N]
+
+Synthetic users (handles starting with bench_) are upserted with their posts, the same way the
+load stage does, while a ticker task measures how late the event loop wakes it up: that lag is
+what the browser pages suffer while the database is being written.
+The synthetic rows are deleted once done.
+"""
+from pathlib import Path
+from datetime import datetime, timedelta
+import argparse
+import logging
+import asyncio
+import time
+import sys
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'src'))
+
+from classes.entities import XUser, XPost
+from tools.logger import logger
+import main.adb as adb
+import main.db as db
+
+BENCH_PREFIX = 'bench_'
+TICK = 0.01 # Seconds between two event loop lag measures
+
+
+def make_users(uid, user_count, post_count, run):
+    """Synthetic users, post ids are unique across runs so that every run really inserts"""
+    users = []
+    for i in range(user_count):
+        handle = f'{BENCH_PREFIX}{i}'
+        user = XUser(
+            uid, handle, f'Bench user {i}', False, 'Synthetic user', datetime(2020, 1, 1),
+            100, 100, '100', '100', None, True
+        )
+        for j in range(post_count):
+            post_id = -((run * user_count + i) * post_count + j + 1) # Real post ids are positive
+            user.add_article(XPost(
+                post_id, datetime(2025, 1, 1) + timedelta(minutes=j), user.username, handle,
+                'Synthetic post', 1, 2, 3, 4, False
+            ))
+        users.append(user)
+    return users
+
+
+async def measure_lag(stop, lags):
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        expected = loop.time() + TICK
+        await asyncio.sleep(TICK)
+        lags.append(loop.time() - expected)
+
+
+async def run_path(name, upsert, users, batch_size):
+    """Upsert all users batch by batch while measuring the event loop lag
+    Returns:
+        Elapsed time, max lag and mean lag, in seconds
+    """
+    stop = asyncio.Event()
+    lags = []
+    ticker = asyncio.create_task(measure_lag(stop, lags))
+
+    start = time.perf_counter()
+    for i in range(0, len(users), batch_size):
+        if not await upsert(users[i:i + batch_size]):
+            sys.exit(f'{name}: batch upsertion failed, see the logs')
+    elapsed = time.perf_counter() - start
+
+    stop.set()
+    await ticker
+    return elapsed, max(lags, default=0), sum(lags) / len(lags) if lags else 0
+
+
+async def blocking_upsert(batch):
+    # What the pipeline did before: psycopg2 called straight from the event loop
+    return XUser.upsert_many(batch)
+
+
+async def threaded_upsert(batch):
+    return await asyncio.to_thread(XUser.upsert_many, batch)
+
+
+def cleanup():
+    # Posts are deleted along with their users (ON DELETE CASCADE)
+    db.execute_query(None, 'DELETE FROM users WHERE handle LIKE %s', (f'{BENCH_PREFIX}%',))
+
+
+async def main():
+    arg_parser = argparse.ArgumentParser(description='Sync vs async load path benchmark')
+    arg_parser.add_argument('--users', type=int, default=200)
+    arg_parser.add_argument('--posts', type=int, default=20, help='Posts per user')
+    arg_parser.add_argument('--batch', type=int, default=50, help='Users per transaction')
+    args = arg_parser.parse_args()
+
+    logger.setLevel(logging.WARNING) # Keep the insertion logs out of the results
+    if not db.check_pool() or not await adb.check_pool():
+        sys.exit('Unable to reach the database')
+
+    uid = db.register_get_uid()
+    paths = (
+        ('sync (blocking)', blocking_upsert),
+        ('sync (thread)', threaded_upsert),
+        ('async', XUser.aupsert_many)
+    )
+
+    print(f'{args.users} users, {args.posts} posts each, {args.batch} users per transaction\n')
+    print(f'{"path":<16} {"total (s)":>10} {"max lag (ms)":>13} {"mean lag (ms)":>14}')
+    try:
+        for run, (name, upsert) in enumerate(paths):
+            cleanup()
+            users = make_users(uid, args.users, args.posts, run)
+            elapsed, max_lag, mean_lag = await run_path(name, upsert, users, args.batch)
+            print(f'{name:<16} {elapsed:>10.2f} {max_lag * 1000:>13.1f} {mean_lag * 1000:>14.1f}')
+    finally:
+        cleanup()
+        db.close_pool()
+        await adb.close_pool()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
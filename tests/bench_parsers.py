@@ -0,0 +1,72 @@
+"""Parse speed benchmark of the transform layer for each parser backend
+
+Usage (from the repository root):
+    python tests/bench_parsers.py [saved_pages_dir] [--rounds N]
+
+saved_pages_dir should contain profile pages saved with page.content(), named <handle>.html.
+The small test fixtures are used by default, but real pages (several MB each) are needed
+to get representative numbers.
+"""
+from pathlib import Path
+import argparse
+import logging
+import time
+import sys
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'src'))
+
+from classes.entities import UserExtract
+from main.transform import transform_user_data
+from tools.utils import make_soup, PARSER_BACKENDS
+from selectolax.lexbor import LexborHTMLParser
+from tools.logger import logger
+from config import settings
+
+
+def load_pages(pages_dir):
+    if pages_dir:
+        return [UserExtract(path.stem, path.read_text(encoding='utf-8')) for path in Path(pages_dir).glob('*.html')]
+
+    from test_parsers import FIXTURES_DIR, PROFILE_FIXTURES
+    return [
+        UserExtract(handle, (FIXTURES_DIR / fixture).read_text(encoding='utf-8'))
+        for fixture, handle in PROFILE_FIXTURES.items()
+    ]
+
+
+def bench(func, pages, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for page in pages:
+            func(page)
+    return (time.perf_counter() - start) / (rounds * len(pages))
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Parser backends benchmark')
+    arg_parser.add_argument('pages_dir', nargs='?', help='Directory of saved <handle>.html profile pages')
+    arg_parser.add_argument('--rounds', type=int, default=20)
+    args = arg_parser.parse_args()
+
+    logger.setLevel(logging.WARNING) # Keep the transform logs out of the results
+    pages = load_pages(args.pages_dir)
+    if not pages:
+        sys.exit('No pages to benchmark')
+
+    size_mb = sum(len(page.html) for page in pages) / len(pages) / 1e6
+    print(f'{len(pages)} pages, {size_mb:.2f} MB on average, {args.rounds} rounds\n')
+    print(f'{"backend":<12} {"parse only (ms)":>16} {"full transform (ms)":>20}')
+
+    reference = None
+    for backend in PARSER_BACKENDS:
+        settings['transform']['parser'] = backend
+        parse = LexborHTMLParser if backend == 'lexbor' else make_soup
+        parse_time = bench(lambda page: parse(page.html), pages, args.rounds)
+        transform_time = bench(lambda page: transform_user_data(page, 1), pages, args.rounds)
+
+        reference = reference or transform_time
+        print(f'{backend:<12} {parse_time * 1000:>16.2f} {transform_time * 1000:>20.2f}  (x{reference / transform_time:.1f})')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+from main.followers import FollowerRow
+from main.freshness import FreshnessPolicy
+import pytest
+
+
+FRESHNESS_SETTINGS = {'enabled': True, 'ttl_hours': {'new': 0, 'flagged': 6, 'default': 72}}
+HOUR = 3600
+
+
+###################
+# Helper functions
+
+def make_row(handle, age, follower=True, flagged=False):
+    return FollowerRow(handle, age, follower, flagged, None, 0)
+
+
+######################
+# Unit tests: Buckets
+
+@pytest.mark.parametrize('follower,flagged,bucket', [
+    (True, False, 'default'), (False, False, 'new'), (None, False, 'new'), (True, True, 'flagged'), (False, True, 'flagged')
+])
+def test_get_bucket(follower, flagged, bucket):
+    assert FreshnessPolicy.get_bucket(follower, flagged) == bucket
+
+
+@pytest.mark.parametrize('age,follower,flagged,fresh', [
+    (None, True, False, False), # Never stored
+    (71 * HOUR, True, False, True),
+    (73 * HOUR, True, False, False),
+    (5 * HOUR, True, True, True),
+    (7 * HOUR, True, True, False),
+    (0, False, False, False) # New followers have no TTL
+])
+def test_is_fresh(age, follower, flagged, fresh):
+    assert FreshnessPolicy(FRESHNESS_SETTINGS).is_fresh(age, follower, flagged) is fresh
+
+
+########################
+# Unit tests: Selection
+
+def test_select_stale():
+    policy = FreshnessPolicy(FRESHNESS_SETTINGS)
+    rows = [make_row('fresh', HOUR), make_row('stale', 100 * HOUR), make_row('unknown', None), make_row('new', 1, follower=False)]
+    assert [row.handle for row in policy.select_stale(rows)] == ['stale', 'unknown', 'new']
+    assert policy.skipped == {'default': 1}
+
+
+def test_select_disabled():
+    rows = [make_row('fresh', HOUR)]
+    assert FreshnessPolicy({**FRESHNESS_SETTINGS, 'enabled': False}).select_stale(rows) == rows
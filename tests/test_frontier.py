@@ -0,0 +1,61 @@
+from main.followers import FollowerRow
+from main.frontier import Frontier
+from concurrent.futures import ThreadPoolExecutor
+import main.frontier as frontier_module
+import asyncio
+
+
+CHECKPOINT_SETTINGS = {'batch_size': 2, 'flush_interval': 5}
+
+
+###################
+# Helper functions
+
+def run_in_thread(coro_func):
+    """Run a coroutine on its own event loop: pytest-playwright keeps one running in the main thread"""
+    with ThreadPoolExecutor(1) as executor:
+        return executor.submit(asyncio.run, coro_func()).result()
+
+
+def make_row(handle):
+    return FollowerRow(handle, None, True, False, None, 0)
+
+
+def fake_run_query(monkeypatch, delay):
+    """Stands for the DB: every frontier write takes delay seconds to land
+    Returns:
+        The (handle, state) pairs written, in the order they landed
+    """
+    written = []
+
+    async def run_query(query, params=None, fetchone=False, **_):
+        if fetchone:
+            return (1,)
+        await asyncio.sleep(delay)
+        if 'crawl_frontier' in query:
+            written.extend((handle, state) for handle, state in zip(params[1::8], params[2::8]))
+        return True
+
+    monkeypatch.setattr(frontier_module, 'run_query', run_query)
+    return written
+
+
+#####################################
+# Unit tests: Checkpoint on shutdown
+
+def test_close_waits_for_the_ongoing_flush(monkeypatch):
+    written = fake_run_query(monkeypatch, 0.1)
+
+    async def scenario():
+        frontier = Frontier(1, CHECKPOINT_SETTINGS)
+        await frontier.open()
+        frontier.add([make_row('a'), make_row('b')])
+        # The batch is full: the flush loop is writing it when the handles go on
+        await asyncio.sleep(0.05)
+        frontier.mark('a', 'in_flight')
+        frontier.mark('a', 'done')
+        await frontier.close(finished=False)
+        assert frontier.flusher.done()
+    run_in_thread(scenario)
+
+    assert written == [('a', 'pending'), ('b', 'pending'), ('a', 'done')]
@@ -0,0 +1,109 @@
+from main.graphql import get_operation_name, to_display_count, get_user_fields, get_timeline_tweets
+from main.graphql import USER_OPERATION, TIMELINE_OPERATION
+from main.transform import transform_user_data
+from classes.entities import UserExtract
+from datetime import datetime
+from pathlib import Path
+import json
+import pytest
+
+
+FIXTURES_DIR = Path(__file__).parent / 'fixtures'
+
+
+###################
+# Helper functions
+
+def load_payload(name):
+    return json.loads((FIXTURES_DIR / name).read_text(encoding='utf-8'))
+
+
+@pytest.fixture
+def payloads():
+    return {
+        USER_OPERATION: load_payload('graphql_user.json'),
+        TIMELINE_OPERATION: load_payload('graphql_timeline.json')
+    }
+
+
+##########################
+# Unit tests: Helpers
+
+def test_get_operation_name():
+    url = 'https://x.com/i/api/graphql/qW5u-DAuXpMEG0zA1F7UGQ/UserByScreenName?variables=%7B%7D'
+    assert get_operation_name(url) == USER_OPERATION
+    assert get_operation_name('https://abs.twimg.com/responsive-web/client-web/main.js') is None
+
+
+@pytest.mark.parametrize('count,displayed', [
+    (3, '3'), (1234, '1,234'), (9999, '9,999'), (10000, '10K'), (56789, '56.7K'), (1500000, '1.5M')
+])
+def test_to_display_count(count, displayed):
+    assert to_display_count(count) == displayed
+
+
+##########################
+# Unit tests: Payloads
+
+def test_user_fields(payloads):
+    """Profile fields of a UserByScreenName payload"""
+    fields = get_user_fields(payloads[USER_OPERATION])
+
+    assert fields['handle'] == 'janedoe'
+    assert fields['certified'] is True
+    assert fields['bio'] == 'Coffee, code & cats.'
+    assert fields['following_count'] == 1234
+    assert fields['url'] == 'janedoe.dev/blog'
+
+
+def test_missing_user():
+    """Suspended or missing accounts come back without a User result"""
+    assert get_user_fields({'data': {'user': {}}}) is None
+    assert get_user_fields({'data': {'user': {'result': {'__typename': 'UserUnavailable'}}}}) is None
+
+
+def test_timeline_order(payloads):
+    """Pinned tweet first, conversation modules unfolded, cursors and user modules skipped"""
+    ids = [tweet['rest_id'] for tweet in get_timeline_tweets(payloads[TIMELINE_OPERATION])]
+    assert ids == [
+        '1700000000000000000', '1790000000000000003', '1790000000000000001',
+        '1788000000000000001', '1788000000000000009'
+    ]
+
+
+##########################
+# Unit tests: Transform
+
+def test_transform_graphql(payloads):
+    """Payloads become the same XUser/XPost as a rendered profile would"""
+    xuser = transform_user_data(UserExtract('janedoe', graphql=payloads), 1)
+
+    assert xuser.username == 'Jane Doe'
+    assert xuser.created_at == datetime(2015, 3, 1)
+    assert xuser.followers_str == '56.7K'
+    assert xuser.followers_count == 56700
+
+    # The post Jane replied to is discarded, the repost is stored as the original post
+    assert [post.id for post in xuser.articles] == [
+        '1700000000000000000', '1790000000000000003', '1789000000000000002', '1788000000000000009'
+    ]
+    repost = xuser.articles[2]
+    assert repost.repost is True
+    assert repost.handle == 'someoneelse'
+    assert repost.timestamp == '2024-05-10T19:02:11'
+
+
+def test_transform_graphql_matches_html(payloads):
+    """Profile fields match the ones transformed from the same profile rendered as HTML"""
+    html = (FIXTURES_DIR / 'profile_certified.html').read_text(encoding='utf-8')
+    from_html = transform_user_data(UserExtract('janedoe', html), 1)
+    from_graphql = transform_user_data(UserExtract('janedoe', graphql=payloads), 1)
+
+    for field in ('handle', 'username', 'certified', 'bio', 'created_at', 'following_count',
+                  'followers_count', 'following_str', 'followers_str', 'featured_url'):
+        assert getattr(from_graphql, field) == getattr(from_html, field), field
+
+
+def test_transform_graphql_without_user(payloads):
+    payloads[USER_OPERATION] = {'data': {}}
+    assert transform_user_data(UserExtract('janedoe', graphql=payloads), 1) is None
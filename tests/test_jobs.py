@@ -0,0 +1,122 @@
+from main.jobs import JobLease, enqueue_jobs
+from main.followers import FollowerRow
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from config import settings
+import multiprocessing
+import main.db as db
+import asyncio
+import pytest
+import time
+
+
+# Needs the local Postgres configured in settings.json / .env (python runner.py --setup --dev)
+pytestmark = pytest.mark.skipif(not db.check_pool(), reason='Postgres is not reachable')
+
+TEST_ACCOUNT = 'jobs_test_account'
+JOBS_SETTINGS = {'batch_size': 5, 'lease': 30, 'max_attempts': 2, 'aging': 0}
+
+
+###################
+# Helper functions
+
+def run(coro):
+    """Run a coroutine on its own event loop: pytest-playwright keeps one running in the main thread"""
+    with ThreadPoolExecutor(1) as executor:
+        return executor.submit(asyncio.run, coro).result()
+
+
+def make_rows(count):
+    return [FollowerRow(f'jobs_test_{i}', None, None, False, None, 0) for i in range(count)]
+
+
+def get_jobs(uid):
+    return {
+        handle: (state, attempts) for handle, state, attempts in db.execute_query(
+            None, 'SELECT handle, state, attempts FROM jobs WHERE account_id = %s', (uid,), fetch=True
+        )
+    }
+
+
+def claim_until_empty(uid, worker_id, results):
+    """Run in a worker process: claim batches and complete them until no job is left"""
+    async def work():
+        lease = JobLease(uid, JOBS_SETTINGS, worker_id)
+        claimed = []
+        while rows := await lease.claim():
+            for row in rows:
+                claimed.append(row.handle)
+                lease.mark(row.handle, 'done')
+            await lease.flush()
+        return claimed
+
+    results.put((worker_id, run(work())))
+
+
+@pytest.fixture
+def uid():
+    src_dir = Path(__file__).resolve().parent.parent / 'src'
+    for table in ('accounts', 'jobs'):
+        db.execute_query(None, (src_dir / 'sql' / f'{table}.sql').read_text())
+
+    res = db.execute_query(
+        None, 'INSERT INTO accounts (handle) VALUES (%s) ON CONFLICT (handle) DO UPDATE SET handle = EXCLUDED.handle RETURNING id',
+        (TEST_ACCOUNT,), fetchone=True
+    )
+    yield res[0]
+    # Jobs are deleted along with the account (ON DELETE CASCADE)
+    db.execute_query(None, 'DELETE FROM accounts WHERE handle = %s', (TEST_ACCOUNT,))
+
+
+##########################
+# Integration tests: Jobs
+
+def test_concurrent_workers_claim_each_job_once(uid):
+    """Several worker processes against one database: every job is processed, by exactly one of them"""
+    rows = make_rows(60)
+    assert run(enqueue_jobs(uid, rows, settings['scheduler']['weights']))
+
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    workers = [context.Process(target=claim_until_empty, args=(uid, f'worker-{i}', results)) for i in range(4)]
+    for worker in workers:
+        worker.start()
+    claimed = dict(results.get(timeout=60) for _ in workers)
+    for worker in workers:
+        worker.join(timeout=10)
+
+    handles = [handle for worker_claims in claimed.values() for handle in worker_claims]
+    assert sorted(handles) == sorted(row.handle for row in rows)
+    assert all(state == 'done' for state, _ in get_jobs(uid).values())
+
+
+def test_expired_lease_is_claimed_again(uid):
+    """The jobs of a worker that stopped heartbeating go to another worker, the first one can't complete them"""
+    run(enqueue_jobs(uid, make_rows(3), settings['scheduler']['weights']))
+
+    crashed = JobLease(uid, {**JOBS_SETTINGS, 'lease': 1}, 'crashed')
+    assert len(run(crashed.claim())) == 3
+    time.sleep(1.5)
+
+    survivor = JobLease(uid, JOBS_SETTINGS, 'survivor')
+    assert len(run(survivor.claim())) == 3
+
+    for handle in list(crashed.held):
+        crashed.mark(handle, 'done')
+    run(crashed.flush())
+    assert all(state == 'claimed' and attempts == 2 for state, attempts in get_jobs(uid).values())
+
+
+def test_failed_jobs_are_retried_until_max_attempts(uid):
+    run(enqueue_jobs(uid, make_rows(1), settings['scheduler']['weights']))
+    lease = JobLease(uid, JOBS_SETTINGS, 'worker')
+
+    expected_states = ['queued'] * (JOBS_SETTINGS['max_attempts'] - 1) + ['failed']
+    for expected_state in expected_states:
+        rows = run(lease.claim())
+        assert len(rows) == 1
+        lease.mark(rows[0].handle, 'failed')
+        run(lease.flush())
+        assert [state for state, _ in get_jobs(uid).values()] == [expected_state]
+
+    assert run(lease.claim()) == []
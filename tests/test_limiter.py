@@ -0,0 +1,98 @@
+from main.infra import AdaptiveLimiter
+from concurrent.futures import ThreadPoolExecutor
+import main.infra as infra
+import asyncio
+import pytest
+
+
+LIMITER_SETTINGS = {'min': 1, 'max': 4, 'initial': 2, 'latency_target': 15, 'backoff': 0.5, 'cooldown': 10}
+
+
+###################
+# Helper functions
+
+def run_in_thread(coro_func):
+    """Run a coroutine on its own event loop: pytest-playwright keeps one running in the main thread"""
+    with ThreadPoolExecutor(1) as executor:
+        return executor.submit(asyncio.run, coro_func()).result()
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Controls the time seen by the limiter cooldown"""
+    now = [1000.0]
+    monkeypatch.setattr(infra.time, 'monotonic', lambda: now[0])
+    return now
+
+
+###########################
+# Unit tests: AIMD limiter
+
+def test_initial_limit_within_bounds():
+    assert AdaptiveLimiter({**LIMITER_SETTINGS, 'initial': 10}).limit == 4
+    assert AdaptiveLimiter({**LIMITER_SETTINGS, 'initial': 0}).limit == 1
+
+
+def test_increase_after_a_full_window():
+    limiter = AdaptiveLimiter(LIMITER_SETTINGS)
+    assert not limiter.on_success(1)
+    assert limiter.on_success(1)
+    assert limiter.limit == 3
+    # The window is as wide as the new limit
+    assert not limiter.on_success(1)
+    assert not limiter.on_success(1)
+    assert limiter.on_success(1)
+    assert limiter.limit == 4
+
+
+def test_increase_stops_at_max():
+    limiter = AdaptiveLimiter({**LIMITER_SETTINGS, 'initial': 4})
+    assert not any(limiter.on_success(1) for _ in range(20))
+    assert limiter.limit == 4
+
+
+def test_decrease_on_failure_and_slow_page(clock):
+    limiter = AdaptiveLimiter({**LIMITER_SETTINGS, 'initial': 4})
+    assert limiter.decrease('timeout')
+    assert limiter.limit == 2
+    clock[0] += 11
+    assert limiter.on_success(30)
+    assert limiter.limit == 1
+
+
+def test_decrease_stops_at_min(clock):
+    limiter = AdaptiveLimiter(LIMITER_SETTINGS)
+    for _ in range(5):
+        limiter.decrease('timeout')
+        clock[0] += 11
+    assert limiter.limit == 1
+
+
+def test_cooldown_ignores_failures_of_the_same_burst(clock):
+    limiter = AdaptiveLimiter({**LIMITER_SETTINGS, 'initial': 4})
+    limiter.decrease('timeout')
+    clock[0] += 5
+    assert not limiter.decrease('timeout')
+    assert limiter.limit == 2
+    clock[0] += 6
+    assert limiter.decrease('timeout')
+    assert limiter.limit == 1
+
+
+def test_increase_wakes_up_waiting_calls():
+    async def scenario():
+        limiter = AdaptiveLimiter({**LIMITER_SETTINGS, 'initial': 1})
+        entered = asyncio.Event()
+
+        async def call():
+            async with limiter:
+                entered.set()
+
+        async with limiter:
+            waiting = asyncio.create_task(call())
+            await asyncio.sleep(0)
+            assert not entered.is_set()
+            await limiter.record_success(1)
+            await asyncio.wait_for(entered.wait(), 1)
+        await waiting
+    run_in_thread(scenario)
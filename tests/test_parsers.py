@@ -0,0 +1,58 @@
+from classes.entities import UserExtract
+from main.transform import transform_user_data
+from tools.utils import make_soup, PARSER_BACKENDS
+from dataclasses import asdict
+from pathlib import Path
+from config import settings
+import pytest
+
+
+FIXTURES_DIR = Path(__file__).parent / 'fixtures'
+# Saved profile pages and the handle of the profile each one belongs to
+PROFILE_FIXTURES = {
+    'profile_certified.html': 'janedoe',
+    'profile_minimal.html': 'bot48213'
+}
+
+
+###################
+# Helper functions
+
+def transform_with(backend, fixture, handle, monkeypatch):
+    monkeypatch.setitem(settings['transform'], 'parser', backend)
+    html = (FIXTURES_DIR / fixture).read_text(encoding='utf-8')
+    xuser = transform_user_data(UserExtract(handle, html), 1)
+    assert xuser is not None, f'{backend} failed to transform {fixture}'
+    return asdict(xuser)
+
+
+###########################
+# Unit tests: Parser parity
+
+@pytest.mark.parametrize('fixture,handle', PROFILE_FIXTURES.items())
+@pytest.mark.parametrize('backend', [b for b in PARSER_BACKENDS if b != 'html.parser'])
+def test_backend_parity(backend, fixture, handle, monkeypatch):
+    """Every parser backend must produce exactly the same fields as html.parser"""
+    reference = transform_with('html.parser', fixture, handle, monkeypatch)
+    assert transform_with(backend, fixture, handle, monkeypatch) == reference
+
+
+def test_reference_fields(monkeypatch):
+    """Sanity check of the reference output, so that parity isn't checked against an empty result"""
+    xuser = transform_with('html.parser', 'profile_certified.html', 'janedoe', monkeypatch)
+
+    assert xuser['username'] == 'Jane Doe'
+    assert xuser['certified'] is True
+    assert xuser['following_count'] == 1234
+    assert xuser['followers_count'] == 56700
+    assert xuser['featured_url'] == 'janedoe.dev/blog'
+    # The reply to another user's post is discarded, the repost is kept
+    assert [post['id'] for post in xuser['articles']] == [
+        '1790000000000000003', '1789000000000000002', '1788000000000000009'
+    ]
+    assert [post['repost'] for post in xuser['articles']] == [False, True, False]
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        make_soup('<html></html>', 'html5lib')
@@ -0,0 +1,88 @@
+from main.followers import FollowerRow
+from main.scheduler import Scheduler, get_priority
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+
+
+WEIGHTS = {'new': 100, 'flagged': 50, 'stale_per_day': 2, 'max_stale_days': 30, 'failure': 20}
+SCHEDULER_SETTINGS = {'max_pending': 0, 'aging': 0.1, 'weights': WEIGHTS}
+DAY = 86400
+
+
+###################
+# Helper functions
+
+def make_row(handle, age=0, follower=True, flagged=False, failures=0):
+    return FollowerRow(handle, age, follower, flagged, None, failures)
+
+
+def run_in_thread(coro_func):
+    """Run a coroutine on its own event loop: pytest-playwright keeps one running in the main thread"""
+    with ThreadPoolExecutor(1) as executor:
+        return executor.submit(asyncio.run, coro_func()).result()
+
+
+def schedule(puts, aging=SCHEDULER_SETTINGS['aging']):
+    """Key (enqueue time in seconds, row) pairs like Scheduler.put() does
+    Returns:
+        The handles in the order the scheduler serves them
+    """
+    scheduler = Scheduler({**SCHEDULER_SETTINGS, 'aging': aging})
+    keyed = [(*scheduler.get_key(row, enqueued_at), row) for enqueued_at, row in puts]
+    return [row.handle for *_, row in sorted(keyed, key=lambda item: item[:2])]
+
+
+#######################
+# Unit tests: Priority
+
+def test_priority_signals():
+    assert get_priority(make_row('retained'), WEIGHTS) == 0
+    assert get_priority(make_row('new', follower=False), WEIGHTS) == 100
+    assert get_priority(make_row('flagged', flagged=True), WEIGHTS) == 50
+    assert get_priority(make_row('stale', age=10 * DAY), WEIGHTS) == 20
+    assert get_priority(make_row('failing', failures=2), WEIGHTS) == -40
+
+
+def test_priority_staleness_is_capped():
+    # Never stored handles count as the stalest ones
+    assert get_priority(make_row('ancient', age=365 * DAY), WEIGHTS) == 60
+    assert get_priority(make_row('unknown', age=None), WEIGHTS) == 60
+
+
+########################
+# Unit tests: Scheduling
+
+def test_highest_priority_first():
+    rows = [make_row('retained'), make_row('failing', failures=1), make_row('new', follower=False), make_row('flagged', flagged=True)]
+    assert schedule([(0, row) for row in rows]) == ['new', 'flagged', 'retained', 'failing']
+
+
+def test_ties_in_harvest_order():
+    assert schedule([(0, make_row(handle)) for handle in 'abc']) == ['a', 'b', 'c']
+
+
+def test_aging_serves_long_waiting_handles():
+    """A retained follower queued early goes before a new one queued long after it"""
+    early, late = make_row('retained'), make_row('new', follower=False, age=None)
+    # Priority 160 for the new follower: it overtakes the retained one until 1600s of waiting
+    assert schedule([(0, early), (1000, late)]) == ['new', 'retained']
+    assert schedule([(0, early), (2000, late)]) == ['retained', 'new']
+    assert schedule([(0, early), (2000, late)], aging=0) == ['new', 'retained']
+
+
+def test_stopping_leaves_handles_queued():
+    """Draining: the queued handles are no longer served"""
+    async def scenario():
+        scheduler, stopping = Scheduler(SCHEDULER_SETTINGS), asyncio.Event()
+        await scheduler.put(make_row('first'))
+        assert (await scheduler.get(stopping)).handle == 'first'
+
+        waiting = asyncio.create_task(scheduler.get(stopping))
+        await asyncio.sleep(0)
+        stopping.set()
+        assert await asyncio.wait_for(waiting, 1) is None
+
+        await scheduler.put(make_row('second'))
+        assert await scheduler.get(stopping) is None
+        return scheduler.queue.qsize()
+    assert run_in_thread(scenario) == 1
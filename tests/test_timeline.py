@@ -0,0 +1,37 @@
+from main.extract import past_timeline_limit
+from datetime import datetime, timezone
+
+
+HANDLE = 'janedoe'
+OLDEST_DATE = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+
+###################
+# Helper functions
+
+def make_post(post_id, author=HANDLE, repost=False, timestamp='2025-06-01T12:00:00.000Z'):
+    return {'id': str(post_id), 'author': author, 'repost': repost, 'timestamp': timestamp}
+
+
+def past(post, position=1, newest_post_id=100):
+    return past_timeline_limit(post, position, HANDLE, newest_post_id, OLDEST_DATE)
+
+
+############################
+# Unit tests: Scroller limits
+
+def test_own_posts():
+    assert past(make_post(150)) is False
+    assert past(make_post(90)) is True
+    assert past(make_post(150, timestamp='2023-06-01T12:00:00.000Z')) is True
+
+
+def test_posts_that_dont_tell():
+    # Pinned post, repost of an old post, and the parent post of another user above a reply
+    assert past(make_post(90), position=0) is None
+    assert past(make_post(90, repost=True)) is None
+    assert past(make_post(90, author='someone')) is None
+
+
+def test_without_limits():
+    assert past_timeline_limit(make_post(90, timestamp='2020-01-01T00:00:00.000Z'), 1, HANDLE, None, None) is False
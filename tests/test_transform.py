@@ -0,0 +1,61 @@
+from classes.entities import XPost, XUser
+from main.transform import add_posts
+from datetime import datetime
+from config import settings
+
+
+###################
+# Helper functions
+
+def make_user():
+    return XUser(1, 'janedoe', 'Jane Doe', False, None, datetime(2015, 3, 1), 0, 0, '0', '0', None, True)
+
+
+def get_post(article, handle):
+    """Stands for get_post_instance(): articles are (id, repost) tuples, None for an invalid post"""
+    if article is None:
+        return None
+    post_id, repost = article
+    return XPost(str(post_id), datetime(2025, 1, 1), 'Jane Doe', handle, '', 0, 0, 0, 0, repost)
+
+
+def added_ids(articles, newest_post_id=None):
+    xuser = make_user()
+    add_posts(xuser, articles, get_post, newest_post_id)
+    return [int(post.id) for post in xuser.articles]
+
+
+##########################
+# Unit tests: High-water mark
+
+def test_no_known_post():
+    assert added_ids([(30, False), (20, False), (10, False)]) == [30, 20, 10]
+
+
+def test_skips_known_posts():
+    assert added_ids([(30, False), (20, False), (10, False)], newest_post_id=20) == [30]
+
+
+def test_stops_after_known_streak(monkeypatch):
+    monkeypatch.setitem(settings['timeline'], 'stop_streak', 2)
+    assert added_ids([(30, False), (20, False), (10, False), (25, False)], newest_post_id=20) == [30]
+
+
+def test_self_reply_thread():
+    """The old parent post shows up above the new self-reply: the newer posts after it are kept"""
+    assert added_ids([(200, False), (90, False), (150, False), (120, False)], newest_post_id=100) == [200, 150, 120]
+
+
+def test_pinned_post_never_stops():
+    """The pinned post is older than the known post but comes first: the newer posts after it are kept"""
+    assert added_ids([(5, False), (30, False), (20, False), (10, False)], newest_post_id=20) == [5, 30]
+
+
+def test_pinned_post_after_discarded_article():
+    """An invalid first article doesn't move the pinned post exemption to the next one"""
+    assert added_ids([None, (5, False), (30, False), (20, False)], newest_post_id=20) == [5, 30]
+
+
+def test_repost_never_stops():
+    """Reposts carry the ID of the original post, older than the known post"""
+    assert added_ids([(30, False), (1, True), (25, False), (20, False)], newest_post_id=20) == [30, 1, 25]
@@ -0,0 +1,69 @@
+from classes.entities import FollowerCell
+from main.followers import FollowerRow
+from main.triage import Triage
+from config import settings
+import pytest
+
+
+###################
+# Helper functions
+
+def make_triage(**overrides):
+    return Triage(1, {**settings['triage'], **overrides})
+
+
+def make_row(handle, follower=True, flagged=False):
+    return FollowerRow(handle, None, follower, flagged, None, 0)
+
+
+def selected_handles(triage, chunk):
+    selected, _ = triage.select(*chunk)
+    return [row.handle for row in selected]
+
+
+@pytest.fixture
+def chunk():
+    """A suspect, a new follower, a stale retained one and a fresh retained one"""
+    cells = [
+        FollowerCell('bot48213', '', False, None),
+        FollowerCell('newcomer', 'New Comer', False, 'Hello'),
+        FollowerCell('stale_friend', 'Stale Friend', False, 'Hello'),
+        FollowerCell('fresh_friend', 'Fresh Friend', False, 'Hello')
+    ]
+    rows = [make_row('bot48213'), make_row('newcomer', follower=None), make_row('stale_friend'), make_row('fresh_friend')]
+    stale = [rows[1], rows[2]]
+    return cells, rows, stale
+
+
+####################
+# Unit tests: Rules
+
+def test_evaluate_suspect():
+    suspect, matched = make_triage().evaluate(FollowerCell('bot48213', '', False, 'Crypto airdrop, DM me'))
+    assert suspect
+    assert set(matched) == {'numbered_handle', 'no_display_name', 'spam_bio'}
+
+
+def test_evaluate_below_threshold():
+    suspect, matched = make_triage().evaluate(FollowerCell('janedoe', 'Jane Doe', True, None))
+    assert not suspect
+    assert matched == ['no_bio']
+
+
+####################
+# Unit tests: Selection
+
+def test_select_suspects_new_and_stale(chunk):
+    assert selected_handles(make_triage(), chunk) == ['bot48213', 'newcomer', 'stale_friend']
+
+
+def test_select_spare_retained(chunk):
+    assert selected_handles(make_triage(spare_retained=True), chunk) == ['newcomer']
+
+
+def test_select_verdicts(chunk):
+    triage = make_triage()
+    _, verdicts = triage.select(*chunk)
+    assert verdicts['bot48213'] == (True, ['numbered_handle', 'no_bio', 'no_display_name'])
+    assert verdicts['newcomer'] == (False, [])
+    assert triage.counts == {'triaged': 4, 'suspects': 1, 'forced': 1, 'spared': 0}